@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+Local stand-ins for the Reddit, Twitter and SerpApi APIs, plus the REST backend
+contract the mcp_server.py proxy expects, so the servers can be benchmarked
+without API keys or quota.
+
+Responses are synthetic, or replayed from a recordings directory holding
+reddit_search.json, reddit_comments.json, twitter_search.json and serpapi_search.json.
+Every response can be delayed (latency plus jitter) and a fraction of them
+replaced by 429/500 errors. Rate-limit headers report a large, quickly resetting
+window by default, so neither PRAW nor the servers' own limiters throttle the
+benchmark; lower --rate-remaining or raise --rate-reset to exercise throttling.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class FakeConfig:
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, items=10, recordings=None,
+                 rate_remaining=100000, rate_reset=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.items = items
+        # PRAW sleeps to spread the remaining requests over the reset window, so a
+        # long window with few requests used would throttle every Reddit call
+        self.rate_remaining = rate_remaining
+        self.rate_reset = rate_reset
+        self.recordings = {}
+        if recordings:
+            for name in ("reddit_search", "reddit_comments", "twitter_search", "serpapi_search"):
+                path = os.path.join(recordings, f"{name}.json")
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as handle:
+                        self.recordings[name] = json.load(handle)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+def _text(index, words=60):
+    return " ".join(f"word{(index * 7 + n) % 97}" for n in range(words))
+
+
+def reddit_search(config, query, limit):
+    if "reddit_search" in config.recordings:
+        return config.recordings["reddit_search"]
+    children = []
+    for n in range(min(limit, config.items)):
+        post_id = f"p{abs(hash((query, n))) % 10 ** 8:x}"
+        children.append({"kind": "t3", "data": {
+            "id": post_id,
+            "name": f"t3_{post_id}",
+            "title": f"{query} post {n}",
+            "subreddit": "benchmark",
+            "author": f"user{n}",
+            "score": 100 - n,
+            "num_comments": 3,
+            "created_utc": time.time() - n * 60,
+            "url": f"https://example.com/{query}/{n}",
+            "selftext": _text(n),
+            "permalink": f"/r/benchmark/comments/{post_id}/post_{n}/",
+        }})
+    return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+
+def reddit_comments(config, post_id):
+    if "reddit_comments" in config.recordings:
+        return config.recordings["reddit_comments"]
+    submission = {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": {
+        "id": post_id, "name": f"t3_{post_id}", "title": "post", "subreddit": "benchmark",
+        "author": "op", "score": 1, "num_comments": 3, "created_utc": time.time(),
+        "url": "https://example.com", "selftext": "", "permalink": f"/r/benchmark/comments/{post_id}/post/",
+    }}], "after": None, "before": None}}
+    comments = {"kind": "Listing", "data": {"children": [
+        {"kind": "t1", "data": {
+            "id": f"c{post_id}{n}", "name": f"t1_c{post_id}{n}", "author": f"commenter{n}",
+            "body": _text(n, 30), "score": 10 - n, "created_utc": time.time(), "link_id": f"t3_{post_id}",
+            "parent_id": f"t3_{post_id}", "permalink": f"/r/benchmark/comments/{post_id}/post/c{n}/",
+            "replies": "", "depth": 0,
+        }} for n in range(3)
+    ], "after": None, "before": None}}
+    return [submission, comments]
+
+
+def twitter_search(config, query, max_results, next_token):
+    if "twitter_search" in config.recordings:
+        return config.recordings["twitter_search"]
+    page = int(next_token or 0)
+    count = min(max_results, config.items)
+    tweets = [{
+        "id": str(10 ** 15 + page * 1000 + n),
+        "text": f"{query} {_text(n, 20)}",
+        "created_at": "2025-01-01T00:00:00.000Z",
+        "author_id": str(n),
+        "public_metrics": {"retweet_count": n, "reply_count": n, "like_count": n * 2, "quote_count": 0},
+    } for n in range(count)]
+    users = [{"id": str(n), "username": f"user{n}", "name": f"User {n}",
+              "profile_image_url": f"https://example.com/{n}.png"} for n in range(count)]
+    meta = {"result_count": count}
+    if page < 4:
+        meta["next_token"] = str(page + 1)
+    return {"data": tweets, "includes": {"users": users}, "meta": meta}
+
+
+def serpapi_search(config, query, start=0, num=None):
+    if "serpapi_search" in config.recordings:
+        return config.recordings["serpapi_search"]
+    return {"organic_results": [{
+        "position": n + 1,
+        "title": f"{query} result {n}",
+        "link": f"https://example.com/{query}/{n}?utm_source=bench",
+        "snippet": _text(n, 25),
+    } for n in range(start, start + (num or config.items))]}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _simulate(self):
+            """Apply the configured latency; return False when an error was injected and sent."""
+            with config.lock:
+                config.requests += 1
+            delay = config.latency + random.uniform(0, config.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if config.error_rate and random.random() < config.error_rate:
+                with config.lock:
+                    config.errors += 1
+                if random.random() < 0.5:
+                    self._send(429, {"error": "Too Many Requests"}, {"Retry-After": "0.1"})
+                else:
+                    self._send(500, {"error": "Internal Server Error"})
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            rate_headers = {
+                "x-ratelimit-remaining": str(config.rate_remaining), "x-ratelimit-reset": str(config.rate_reset),
+                "x-ratelimit-used": "0",
+                "x-rate-limit-remaining": str(config.rate_remaining),
+                "x-rate-limit-reset": str(int(time.time()) + config.rate_reset),
+            }
+            if url.path == "/stats":
+                self._send(200, {"requests": config.requests, "errors": config.errors})
+                return
+            if not self._simulate():
+                return
+            path = url.path.rstrip("/")
+            if path.endswith("/search") and "/r/" in path:
+                self._send(200, reddit_search(config, query.get("q", ""), int(query.get("limit", 25))), rate_headers)
+            elif path.startswith("/comments/"):
+                self._send(200, reddit_comments(config, path.split("/")[2]), rate_headers)
+            elif path == "/2/tweets/search/recent":
+                self._send(200, twitter_search(
+                    config, query.get("query", ""), int(query.get("max_results", 10)), query.get("next_token")
+                ), rate_headers)
+            elif path in ("/search", "/search.json"):
+                self._send(200, serpapi_search(
+                    config, query.get("q", ""), int(query.get("start", 0)), int(query.get("num", 0)) or None
+                ))
+            else:
+                self._send(404, {"error": f"Unknown path {url.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length) if length else b""
+            path = urlparse(self.path).path
+            # PRAW's token request is form-encoded; only the proxy contract below sends JSON
+            if path == "/api/v1/access_token":
+                self._send(200, {"access_token": "bench", "token_type": "bearer", "expires_in": 3600, "scope": "*"})
+                return
+            if not self._simulate():
+                return
+            body = json.loads(raw or b"{}")
+            # Backend contract used by the mcp_server.py proxy
+            if path == "/fetch_posts_by_title":
+                keyword = body.get("title_keyword", "")
+                posts = [child["data"] for child in reddit_search(config, keyword, body.get("limit", 3))["data"]["children"]]
+                self._send(200, {"keyword": keyword, "sort": body.get("sort"), "posts": posts, "count": len(posts)})
+            elif path == "/fetch_tweets_by_keyword":
+                keyword = body.get("keyword", "")
+                tweets = twitter_search(config, keyword, body.get("limit", 3), None)["data"]
+                self._send(200, {"keyword": keyword, "tweets": tweets, "count": len(tweets)})
+            elif path == "/search":
+                query = body.get("params", {}).get("q", "")
+                results = serpapi_search(config, query).get("organic_results", [])
+                self._send(200, {"engine": "google", "query": query, "results": results, "count": len(results)})
+            else:
+                self._send(404, {"error": f"Unknown path {path}"})
+
+    return Handler
+
+
+def start_fake_upstreams(host="127.0.0.1", port=0, **options):
+    """Start the fake upstreams on a background thread and return (server, base_url)."""
+    config = FakeConfig(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="fake-upstreams", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info("Fake upstreams listening on %s", base_url)
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake Reddit, Twitter and SerpApi endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of responses replaced by 429/500")
+    parser.add_argument("--items", type=int, default=10, help="Items per synthetic page")
+    parser.add_argument("--recordings", help="Directory of recorded JSON responses to replay")
+    parser.add_argument("--rate-remaining", type=int, default=100000, help="Requests left reported in rate-limit headers")
+    parser.add_argument("--rate-reset", type=int, default=1, help="Seconds until the rate-limit window resets")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server, base_url = start_fake_upstreams(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, items=args.items, recordings=args.recordings,
+        rate_remaining=args.rate_remaining, rate_reset=args.rate_reset
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
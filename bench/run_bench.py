@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Offline benchmark for the MCP servers.
+
+Starts the fake upstreams from fake_upstreams.py, launches each server as a
+subprocess on streamable HTTP pointed at them, drives its main tool at each
+concurrency level and reports p50/p95/p99 latency, requests per second and
+server memory. Results are saved as JSON under bench/results/ so a later run
+can be compared against them with --compare.
+
+    python bench/run_bench.py --concurrency 1,8,32 --requests 200
+    python bench/run_bench.py --compare bench/results/bench-20250101-120000.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import logging
+import subprocess
+
+from fastmcp import Client
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_upstreams import start_fake_upstreams  # noqa: E402
+
+logger = logging.getLogger("bench")
+
+# Scenario name -> (script, environment prefix, tool, arguments for request n)
+SCENARIOS = {
+    "reddit": ("reddit_mcp_server.py", "REDDIT", "fetch_posts_by_title",
+               lambda keyword: {"title_keyword": keyword, "limit": 3}),
+    "twitter": ("twitter_mcp_server.py", "TWITTER", "fetch_tweets_by_keyword",
+                lambda keyword: {"keyword": keyword, "limit": 10}),
+    "serpapi": ("serpapi_mcp_server.py", "SERPAPI", "search",
+                lambda keyword: {"params": {"q": keyword}}),
+    "proxy": ("mcp_server.py", "PROXY", "fetch_posts_by_title",
+              lambda keyword: {"title_keyword": keyword, "limit": 3}),
+    # All three sources in one process; compare its startup_s/rss_mb with the sum of the three above
+    "consolidated": ("consolidated_server.py", "CONSOLIDATED", "reddit_fetch_posts_by_title",
+                     lambda keyword: {"title_keyword": keyword, "limit": 3}),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server on port {port} was not ready within {timeout}s")
+
+
+def memory_mb(pid):
+    """Current and peak resident memory of a process in MB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as handle:
+            fields = dict(line.split(":", 1) for line in handle if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def server_env(prefix, port, upstream_url, use_cache):
+    env = dict(os.environ)
+    env.update({
+        f"{prefix}_MCP_TRANSPORT": "streamable-http",
+        f"{prefix}_MCP_PORT": str(port),
+        "LOG_LEVEL": os.getenv("BENCH_LOG_LEVEL", "WARNING"),
+        # Fake credentials and hosts for every upstream
+        "REDDIT_CLIENT_ID": "bench", "REDDIT_CLIENT_SECRET": "bench",
+        "REDDIT_OAUTH_URL": upstream_url, "REDDIT_URL": upstream_url,
+        "TWITTER_BEARER_TOKEN": "bench", "TWITTER_API_BASE": upstream_url,
+        "SERPAPI_API_KEY": "bench", "SERPAPI_BASE_URL": upstream_url,
+        "PROXY_REDDIT_URL": upstream_url, "PROXY_TWITTER_URL": upstream_url, "PROXY_SERPAPI_URL": upstream_url,
+        # Measure the servers, not the local rate limiter
+        "REDDIT_RATE_LIMIT_PER_SEC": "100000", "REDDIT_RATE_LIMIT_BURST": "100000",
+        "TWITTER_RATE_LIMIT_PER_SEC": "100000", "TWITTER_RATE_LIMIT_BURST": "100000",
+        "SERPAPI_RATE_LIMIT_PER_SEC": "100000", "SERPAPI_RATE_LIMIT_BURST": "100000",
+        "RATE_LIMIT_BACKOFF_BASE": "0.05",
+    })
+    if not use_cache:
+        env["RESPONSE_CACHE_DISABLED"] = "1"
+    return env
+
+
+async def drive(url, tool, make_args, requests, concurrency, repeat_keywords):
+    """Issue `requests` tool calls with at most `concurrency` in flight; return latencies, errors and wall time."""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with Client(url) as client:
+        async def one(n):
+            nonlocal errors
+            keyword = "benchmark" if repeat_keywords else f"benchmark {n}"
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    result = await client.call_tool(tool, make_args(keyword))
+                    text = "".join(getattr(block, "text", "") for block in getattr(result, "content", result) or [])
+                    if text.startswith(("Error:", '{\n  "error"', '{"error"')):
+                        errors += 1
+                except Exception as e:
+                    logger.debug("Call %s failed: %s", n, e)
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(requests)))
+        wall = time.perf_counter() - started
+    return sorted(latencies), errors, wall
+
+
+def run_scenario(name, upstream_url, levels, requests, use_cache, repeat_keywords):
+    script, prefix, tool, make_args = SCENARIOS[name]
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, script)],
+        env=server_env(prefix, port, upstream_url, use_cache),
+        cwd=REPO_DIR,
+    )
+    results = []
+    try:
+        wait_for_port(port, process)
+        startup = time.perf_counter() - started
+        idle_rss, _ = memory_mb(process.pid)
+        logger.info("%s ready in %.2fs (%.1f MB)", script, startup, idle_rss or 0)
+        url = f"http://127.0.0.1:{port}/mcp"
+        for concurrency in levels:
+            latencies, errors, wall = asyncio.run(drive(url, tool, make_args, requests, concurrency, repeat_keywords))
+            rss, peak = memory_mb(process.pid)
+            row = {
+                "scenario": name,
+                "concurrency": concurrency,
+                "requests": requests,
+                "errors": errors,
+                "rps": round(requests / wall, 2) if wall else None,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                "startup_s": round(startup, 3),
+                "rss_mb": round(rss, 1) if rss else None,
+                "peak_rss_mb": round(peak, 1) if peak else None,
+            }
+            results.append(row)
+            logger.info(
+                "%-8s c=%-4d rps=%-8s p50=%-8s p95=%-8s p99=%-8s errors=%d rss=%sMB",
+                name, concurrency, row["rps"], row["p50_ms"], row["p95_ms"], row["p99_ms"], errors, row["rss_mb"]
+            )
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+
+def compare(current, baseline_path):
+    """Print the change in throughput and tail latency against a saved run."""
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = {(row["scenario"], row["concurrency"]): row for row in json.load(handle)["results"]}
+    print(f"\nComparison against {baseline_path}:")
+    print(f"{'scenario':<10}{'conc':>6}{'rps':>12}{'Δrps%':>9}{'p95 ms':>10}{'Δp95%':>9}")
+    for row in current:
+        before = baseline.get((row["scenario"], row["concurrency"]))
+        if not before:
+            continue
+        rps_delta = (row["rps"] - before["rps"]) / before["rps"] * 100 if before["rps"] else 0
+        p95_delta = (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+        print(f"{row['scenario']:<10}{row['concurrency']:>6}{row['rps']:>12}{rps_delta:>+9.1f}"
+              f"{row['p95_ms']:>10}{p95_delta:>+9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MCP servers against local fake upstreams.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Tool calls per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random upstream latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream responses that fail")
+    parser.add_argument("--recordings", help="Directory of recorded upstream responses to replay")
+    parser.add_argument("--rate-remaining", type=int, default=100000, help="Requests left reported in upstream rate-limit headers")
+    parser.add_argument("--rate-reset", type=int, default=1, help="Seconds until the upstream rate-limit window resets")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache enabled")
+    parser.add_argument("--repeat-keywords", action="store_true", help="Use the same keyword for every call")
+    parser.add_argument("--output-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--compare", metavar="RESULTS_JSON", help="Saved results to compare against")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    server, upstream_url = start_fake_upstreams(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, recordings=args.recordings,
+        rate_remaining=args.rate_remaining, rate_reset=args.rate_reset
+    )
+    results = []
+    try:
+        for name in args.scenarios.split(","):
+            results.extend(run_scenario(name.strip(), upstream_url, levels, args.requests, args.cache, args.repeat_keywords))
+    finally:
+        server.shutdown()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    output_path = os.path.join(args.output_dir, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as handle:
+        json.dump({
+            "timestamp": time.time(),
+            "commit": commit,
+            "config": vars(args),
+            "results": results,
+        }, handle, indent=2)
+    logger.info("Saved results to %s", output_path)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
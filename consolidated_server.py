@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import time
+
+# Measured from before the heavy imports, for the startup report
+STARTED = time.perf_counter()
+
+import os
+import sys
+import inspect
+import importlib
+
+# Every source server in this process shares one HTTP connection pool
+os.environ.setdefault("HTTP_POOL_SHARED", "1")
+
+from fastmcp import FastMCP
+from http_pool import get_pool
+from log_setup import setup_logging
+from metrics import resident_memory_mb
+from server_transport import run_server
+
+# Set up logging
+logger = setup_logging("consolidated_server")
+
+# Tool name prefix -> module of the source server whose tools are mounted under it
+SOURCES = {
+    "reddit": "reddit_mcp_server",
+    "twitter": "twitter_mcp_server",
+    "serpapi": "serpapi_mcp_server",
+}
+# Comma-separated subset of SOURCES to serve (default all)
+CONSOLIDATED_SOURCES = [
+    name.strip() for name in os.getenv("CONSOLIDATED_SOURCES", ",".join(SOURCES)).split(",") if name.strip()
+]
+
+
+def mount(server, source, prefix):
+    """Mount `source`'s tools on `server` under `prefix`, across fastmcp's mount() signatures."""
+    parameters = list(inspect.signature(server.mount).parameters)
+    if "namespace" in parameters:
+        server.mount(source, namespace=prefix)
+    elif parameters and parameters[0] == "prefix":
+        # fastmcp < 2.9 takes the prefix first
+        server.mount(prefix, source)
+    else:
+        server.mount(source, prefix=prefix)
+
+
+http_pool = get_pool("HTTP_POOL")
+
+logger.info("Creating consolidated MCP server")
+mcp = FastMCP("consolidated-server", lifespan=http_pool.lifespan)
+
+mounted = {}
+for prefix in CONSOLIDATED_SOURCES:
+    try:
+        module = importlib.import_module(SOURCES[prefix])
+    except Exception as e:
+        # A source with missing credentials is left out instead of taking the others down
+        logger.error("Skipping %s tools: %s", prefix, e)
+        continue
+    mount(mcp, module.mcp, prefix)
+    mounted[prefix] = module
+
+
+# Every source registers /metrics on its own server; mounted, only one of those routes
+# would be reachable, so this process serves all sources' metrics on its own /metrics
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request):
+    from starlette.responses import PlainTextResponse
+    text = "".join(module.metrics.render() for module in mounted.values())
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+STARTUP_SECONDS = time.perf_counter() - STARTED
+logger.info(
+    "Consolidated server mounted %s in %.2fs, RSS %.1f MB (lazy clients loaded: praw=%s, serpapi=%s)",
+    ", ".join(mounted) or "no sources", STARTUP_SECONDS, resident_memory_mb() or 0,
+    "praw" in sys.modules, "serpapi" in sys.modules
+)
+
+if __name__ == "__main__":
+    logger.info("Starting consolidated MCP server")
+    run_server(mcp, "CONSOLIDATED", 8010)
+    logger.info("Consolidated MCP server stopped")
@@ -0,0 +1,236 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Maximum Hamming distance between two SimHashes for their texts to count as near-duplicates
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "3"))
+# Words per shingle when fingerprinting text
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+# Texts with fewer words than this are only matched by URL
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "5"))
+
+SIMHASH_BITS = 64
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "ref_url",
+    "si", "spm", "share_id", "cmpid", "ncid", "_ga", "yclid", "guccounter",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_", "oly_", "vero_")
+# Parameters that are tracking-only on one (canonical) host but carry content elsewhere,
+# e.g. ?s= is a share marker on Twitter and the search term on many sites
+HOST_TRACKING_PARAMS = {"twitter.com": {"s", "t"}}
+
+# Host prefixes that serve the same content as the bare host
+HOST_PREFIXES = ("www.", "m.", "mobile.", "old.", "new.", "amp.")
+HOST_ALIASES = {"x.com": "twitter.com", "youtu.be": "youtube.com", "redd.it": "reddit.com"}
+
+_REDDIT_POST = re.compile(r"^(?:/r/[^/]+)?/comments/([a-z0-9]+)", re.IGNORECASE)
+_URL_IN_TEXT = re.compile(r"https?://[^\s<>\"')\]]+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def canonicalize_url(url: Optional[str]) -> Optional[str]:
+    """
+    Reduce a URL to a canonical form so the same page compares equal across sources:
+    lowercase scheme and host, no "www."/"m."-style prefixes, no tracking parameters
+    or fragment, sorted query and no trailing slash. Reddit permalinks and redd.it
+    short links become https://reddit.com/comments/<id>.
+    """
+    if not url:
+        return None
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    if not parts.netloc:
+        return None
+    host = parts.hostname or ""
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    host = HOST_ALIASES.get(host, host)
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+
+    if host == "reddit.com":
+        match = _REDDIT_POST.match(path)
+        if match:
+            return f"https://reddit.com/comments/{match.group(1).lower()}"
+        if parts.hostname and parts.hostname.endswith("redd.it") and path:
+            return f"https://reddit.com/comments/{path.strip('/').lower()}"
+    if host == "youtube.com" and parts.hostname and parts.hostname.endswith("youtu.be") and path:
+        return f"https://youtube.com/watch?v={path.strip('/')}"
+
+    host_params = HOST_TRACKING_PARAMS.get(host, set())
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and key.lower() not in host_params
+        and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+def _stable_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, shingle_size: int = DEDUP_SHINGLE_SIZE) -> Optional[int]:
+    """64-bit SimHash over word shingles; None for texts too short to fingerprint."""
+    words = [word.lower() for word in _WORD.findall(text or "")]
+    if len(words) < DEDUP_MIN_WORDS:
+        return None
+    size = min(shingle_size, len(words))
+    weights = [0] * SIMHASH_BITS
+    for index in range(len(words) - size + 1):
+        value = _stable_hash(" ".join(words[index:index + size]))
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup for SimHash fingerprints.
+
+    Fingerprints are split into `distance + 1` bands; by the pigeonhole principle two
+    fingerprints within `distance` bits agree exactly on at least one band, so only
+    items sharing a band are compared. Inserts and lookups stay roughly constant time,
+    making a whole batch linear in its size.
+    """
+
+    def __init__(self, distance: int = DEDUP_SIMHASH_DISTANCE):
+        self.distance = distance
+        self.bands = distance + 1
+        self.band_bits = -(-SIMHASH_BITS // self.bands)
+        self._buckets: Dict[tuple, List[tuple]] = {}
+
+    def _keys(self, fingerprint: int) -> Iterable[tuple]:
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self.band_bits) & mask
+
+    def query(self, fingerprint: int) -> List[Any]:
+        """Values stored for fingerprints within the configured Hamming distance."""
+        matches = []
+        seen = set()
+        for key in self._keys(fingerprint):
+            for other, value in self._buckets.get(key, ()):
+                if id(value) not in seen and bin(fingerprint ^ other).count("1") <= self.distance:
+                    seen.add(id(value))
+                    matches.append(value)
+        return matches
+
+    def add(self, fingerprint: int, value: Any) -> None:
+        for key in self._keys(fingerprint):
+            self._buckets.setdefault(key, []).append((fingerprint, value))
+
+
+def collect_items(reddit: Optional[dict] = None, twitter: Optional[dict] = None, serpapi: Optional[dict] = None) -> List[dict]:
+    """Flatten the results of the three fetch tools into items with a common shape."""
+    items = []
+    for post in (reddit or {}).get("posts", []):
+        permalink = canonicalize_url(post.get("permalink"))
+        link = canonicalize_url(post.get("url"))
+        items.append({
+            "source": "reddit",
+            "id": post.get("id"),
+            "url": post.get("url") or post.get("permalink"),
+            "title": post.get("title"),
+            "text": " ".join(filter(None, (post.get("title"), post.get("selftext")))),
+            "urls": {url for url in (permalink, link) if url},
+            "score": post.get("score") or 0,
+        })
+    for tweet in (twitter or {}).get("tweets", []):
+        author = ((tweet.get("author") or {}).get("username") or "").lstrip("@")
+        url = f"https://twitter.com/{author if author and author != 'unknown' else 'i'}/status/{tweet.get('id')}"
+        linked = {canonicalize_url(match) for match in _URL_IN_TEXT.findall(tweet.get("text") or "")}
+        items.append({
+            "source": "twitter",
+            "id": tweet.get("id"),
+            "url": url,
+            "title": None,
+            "text": _URL_IN_TEXT.sub(" ", tweet.get("text") or "").strip(),
+            # t.co short links differ per tweet, so they cannot match anything
+            "urls": {canonicalize_url(url)} | {link for link in linked if link and urlsplit(link).hostname != "t.co"},
+            "score": (tweet.get("metrics") or {}).get("like_count") or 0,
+        })
+    for result in (serpapi or {}).get("results", []):
+        items.append({
+            "source": "serpapi",
+            "id": result.get("link"),
+            "url": result.get("link"),
+            "title": result.get("title"),
+            "text": " ".join(filter(None, (result.get("title"), result.get("snippet")))),
+            "urls": {url for url in (canonicalize_url(result.get("link")),) if url},
+            "score": 0,
+        })
+    return items
+
+
+def _find(parents: List[int], index: int) -> int:
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def deduplicate(items: List[dict], distance: int = DEDUP_SIMHASH_DISTANCE) -> Dict[str, Any]:
+    """
+    Group items that share a canonical URL or have near-identical text.
+
+    Returns clusters ordered by size, each with a representative (the item with the
+    most text, then the highest score) and the source/id/url of every member.
+    """
+    parents = list(range(len(items)))
+    by_url: Dict[str, int] = {}
+    index = SimHashIndex(distance)
+    url_matches = text_matches = 0
+
+    for position, item in enumerate(items):
+        for url in item["urls"]:
+            other = by_url.setdefault(url, position)
+            if other != position and _find(parents, other) != _find(parents, position):
+                parents[_find(parents, position)] = _find(parents, other)
+                url_matches += 1
+        fingerprint = simhash(item["text"])
+        if fingerprint is None:
+            continue
+        for other in index.query(fingerprint):
+            if _find(parents, other) != _find(parents, position):
+                parents[_find(parents, position)] = _find(parents, other)
+                text_matches += 1
+        index.add(fingerprint, position)
+
+    groups: Dict[int, List[int]] = {}
+    for position in range(len(items)):
+        groups.setdefault(_find(parents, position), []).append(position)
+
+    clusters = []
+    for members in sorted(groups.values(), key=lambda group: (-len(group), group[0])):
+        representative = max(members, key=lambda position: (len(items[position]["text"]), items[position]["score"]))
+        rep = {key: value for key, value in items[representative].items() if key != "urls"}
+        clusters.append({
+            "representative": rep,
+            "size": len(members),
+            "sources": sorted({items[position]["source"] for position in members}),
+            "members": [
+                {"source": items[position]["source"], "id": items[position]["id"], "url": items[position]["url"]}
+                for position in members
+            ],
+        })
+    logger.debug(
+        "Deduplicated %s items into %s clusters (%s URL matches, %s text matches)",
+        len(items), len(clusters), url_matches, text_matches
+    )
+    return {
+        "clusters": clusters,
+        "count": len(clusters),
+        "input_count": len(items),
+        "duplicates": len(items) - len(clusters),
+    }
@@ -0,0 +1,125 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _http2_available() -> bool:
+    """httpx only speaks HTTP/2 when the optional `h2` package is installed."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPPool:
+    """
+    Long-lived httpx.AsyncClient shared by every tool call in a server process.
+
+    Connections are kept alive between calls, so repeated requests to the same
+    backend reuse an open TCP (and TLS) connection instead of paying setup cost
+    on every call. Limits are read from the environment with the given prefix:
+
+        <PREFIX>_MAX_CONNECTIONS      total open connections (default 100)
+        <PREFIX>_MAX_KEEPALIVE        idle connections kept in the pool (default 20)
+        <PREFIX>_KEEPALIVE_EXPIRY     seconds an idle connection is kept (default 30)
+        <PREFIX>_HTTP2                enable HTTP/2 when `h2` is installed (default off)
+        <PREFIX>_TIMEOUT              default request timeout in seconds (default 30)
+        <PREFIX>_TIMEOUT_<BACKEND>    per-backend timeout override in seconds
+    """
+
+    def __init__(self, prefix: str = "HTTP_POOL", backends: Optional[Dict[str, float]] = None):
+        self.prefix = prefix
+        self.max_connections = int(os.getenv(f"{prefix}_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv(f"{prefix}_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", "30"))
+        self.default_timeout = float(os.getenv(f"{prefix}_TIMEOUT", "30"))
+        self.http2 = _env_bool(f"{prefix}_HTTP2")
+        if self.http2 and not _http2_available():
+            logger.warning("%s_HTTP2 is set but the 'h2' package is not installed, falling back to HTTP/1.1", prefix)
+            self.http2 = False
+
+        self.timeouts: Dict[str, float] = {}
+        for backend, default in (backends or {}).items():
+            env_name = f"{prefix}_TIMEOUT_{backend.upper()}"
+            self.timeouts[backend] = float(os.getenv(env_name, str(default)))
+
+        self._client: Optional[httpx.AsyncClient] = None
+        # Servers inside whose lifespan the pool currently is; one pool can back several mounted servers
+        self._users = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use."""
+        if self._client is None or self._client.is_closed:
+            logger.info(
+                f"Opening HTTP pool {self.prefix}: max_connections={self.max_connections}, "
+                f"max_keepalive={self.max_keepalive}, keepalive_expiry={self.keepalive_expiry}s, "
+                f"http2={self.http2}"
+            )
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.default_timeout),
+                http2=self.http2,
+            )
+        return self._client
+
+    def timeout_for(self, backend: str) -> httpx.Timeout:
+        """Timeout to pass to a request aimed at the named backend."""
+        return httpx.Timeout(self.timeouts.get(backend, self.default_timeout))
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            logger.info("Closing HTTP pool %s", self.prefix)
+            await self._client.aclose()
+        self._client = None
+
+    @asynccontextmanager
+    async def lifespan(self, server=None):
+        """
+        FastMCP lifespan hook: keeps the pool open for the server's lifetime. A pool
+        shared by several servers is closed when the last of their lifespans ends.
+        """
+        self._users += 1
+        try:
+            yield {}
+        finally:
+            self._users -= 1
+            if self._users == 0:
+                await self.aclose()
+
+
+# Pools handed out by get_pool when HTTP_POOL_SHARED is set
+_shared: Optional[HTTPPool] = None
+
+
+def get_pool(prefix: str, backends: Optional[Dict[str, float]] = None) -> HTTPPool:
+    """
+    The pool a server should use. Normally each server gets its own; with
+    HTTP_POOL_SHARED set (as the consolidated server does) every server in the
+    process shares one HTTP_POOL pool, keeping each server's per-backend timeouts.
+    """
+    global _shared
+    if not _env_bool("HTTP_POOL_SHARED"):
+        return HTTPPool(prefix, backends)
+    if _shared is None:
+        _shared = HTTPPool("HTTP_POOL")
+    for backend, default in (backends or {}).items():
+        _shared.timeouts.setdefault(backend, float(os.getenv(f"{prefix}_TIMEOUT_{backend.upper()}", str(default))))
+    return _shared
@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from crewai import LLM
+
+from response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Agents whose LLM calls always go to the provider, e.g. "twitter,aggregate"
+LLM_CACHE_OPT_OUT = {
+    name.strip().lower() for name in os.getenv("LLM_CACHE_OPT_OUT", "").split(",") if name.strip()
+}
+
+
+def prompt_key(model: str, messages: Any, tools: Any = None) -> str:
+    """Cache key for one completion: the model plus a hash of every message (tool results included) and tool schema."""
+    payload = json.dumps({"messages": messages, "tools": tools}, sort_keys=True, separators=(",", ":"), default=str)
+    return f"llm:{model}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class PromptCache(ResponseCache):
+    """
+    Persistent cache of LLM completions, shared by every agent in a run.
+
+    Built on ResponseCache with its own settings:
+
+        LLM_CACHE_DISABLED      always call the provider (default off)
+        LLM_CACHE_PATH          SQLite file (default cache/llm.sqlite3)
+        LLM_CACHE_MEMORY_ITEMS  entries kept in the memory LRU (default 256)
+        LLM_CACHE_MAX_BYTES     total size of the SQLite store (default 50 MB)
+        CACHE_TTL_LLM           TTL in seconds (default 86400)
+        LLM_CACHE_OPT_OUT       comma-separated agent names that bypass the cache
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path, prefix="LLM_CACHE", ttls={"llm": 86400},
+                         default_path=os.path.join("cache", "llm.sqlite3"))
+        self._agent_lock = threading.Lock()
+        self.by_agent: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent: str, outcome: str) -> None:
+        with self._agent_lock:
+            counts = self.by_agent.setdefault(agent, {"hits": 0, "misses": 0, "bypassed": 0})
+            counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._agent_lock:
+            stats["agents"] = {agent: dict(counts) for agent, counts in self.by_agent.items()}
+        return stats
+
+
+class CachedLLM(LLM):
+    """
+    crewai LLM that answers repeated prompts from a PromptCache.
+
+    Only plain text completions are stored; anything else (tool-call objects,
+    streamed responses) is passed through untouched.
+    """
+
+    def __init__(self, *args, cache: Optional[PromptCache] = None, agent_name: str = "default", **kwargs):
+        # Set before LLM.__init__ so they are not forwarded to the provider as extra params
+        self.cache = None if agent_name.lower() in LLM_CACHE_OPT_OUT else cache
+        self.agent_name = agent_name
+        super().__init__(*args, **kwargs)
+
+    def call(self, messages, *args, **kwargs):
+        if self.cache is None or not self.cache.enabled:
+            if self.cache is not None:
+                self.cache.record(self.agent_name, "bypassed")
+            return super().call(messages, *args, **kwargs)
+        key = prompt_key(self.model, messages, kwargs.get("tools", args[0] if args else None))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit for %s (%s)", self.agent_name, self.model)
+            self.cache.record(self.agent_name, "hits")
+            return cached
+        self.cache.record(self.agent_name, "misses")
+        response = super().call(messages, *args, **kwargs)
+        if isinstance(response, str) and response.strip():
+            self.cache.put("llm", key, response)
+        return response
@@ -0,0 +1,102 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Optional
+
+# Fraction of payload dumps that are written (0-1), and the size each is cut to
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, for the log files."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the writer thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, since they may change after the call returns, except
+        # for payload dumps which are serialized by the writer thread. exc_info is kept
+        # so tracebacks are formatted off the calling thread too.
+        record = copy.copy(record)
+        args = record.args if isinstance(record.args, tuple) else ()
+        if not any(isinstance(arg, _Payload) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(name: str, stream=None) -> logging.Logger:
+    """
+    Configure process-wide logging for one script and return its logger.
+
+    Records are put on an in-memory queue and written by a background thread,
+    so the caller never waits on disk I/O. The file under logs/ gets JSON lines
+    and the console stream keeps the plain format. LOG_LEVEL sets the level
+    (default INFO).
+    """
+    global _listener
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    root = logging.getLogger()
+    if _listener is not None:
+        return logging.getLogger(name)
+
+    os.makedirs("logs", exist_ok=True)
+    file_handler = logging.FileHandler(os.path.join("logs", f"{name}.log"))
+    file_handler.setFormatter(JsonLinesFormatter())
+    # MCP stdio servers must keep stdout free for the protocol, so the console defaults to stderr
+    console_handler = logging.StreamHandler(stream or sys.stderr)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logging.getLogger(name)
+
+
+class _Payload:
+    """Defers serializing and truncating a payload until a handler formats the record."""
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        text = self.payload if isinstance(self.payload, str) else json.dumps(self.payload, default=str)
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            return f"{text[:LOG_PAYLOAD_MAX_CHARS]}... [{len(text)} chars]"
+        return text
+
+
+def log_payload(logger: logging.Logger, payload: Any, message: str, *args: Any, level: int = logging.DEBUG) -> None:
+    """
+    Log a (possibly large) upstream payload after `message % args`.
+
+    Only LOG_PAYLOAD_SAMPLE_RATE of the calls are written, each capped at
+    LOG_PAYLOAD_MAX_CHARS, and nothing is serialized unless the record is kept.
+    """
+    if not logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, message + ": %s", *args, _Payload(payload))
@@ -1,91 +1,241 @@
 import subprocess
 import os
 import sys
+import json
 import time
+import select
+import socket
 import signal
-import logging
+from log_setup import setup_logging
+from concurrent.futures import ThreadPoolExecutor
+from server_transport import NETWORK_TRANSPORTS, transport_settings
+from metrics import resident_memory_mb
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/main.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
-
-def run_script(script_name, processes):
-    """Run a Python script in a subprocess and store the process."""
-    logger.debug(f"Checking if {script_name} exists")
-    if not os.path.exists(script_name):
-        logger.error(f"Error: {script_name} not found")
-        return
+logger = setup_logging("main", sys.stdout)
+
+# Overall time allowed for every server to become ready
+STARTUP_DEADLINE = float(os.getenv("STARTUP_DEADLINE", "60"))
+# MCP protocol version offered in the readiness handshake with stdio servers
+MCP_PROTOCOL_VERSION = "2024-11-05"
+# Supervised restarts of servers that crash while the agent is running
+RESTART_MAX_ATTEMPTS = int(os.getenv("RESTART_MAX_ATTEMPTS", "5"))
+RESTART_BACKOFF_BASE = float(os.getenv("RESTART_BACKOFF_BASE", "1"))
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", "30"))
+# "multi" runs one process per server plus the proxy, "consolidated" serves every source from one process
+MCP_SERVER_MODE = os.getenv("MCP_SERVER_MODE", "multi").lower()
+
+
+class Server:
+    """A server script managed by main.py, with the settings used to probe it."""
+
+    def __init__(self, script, name, port):
+        self.script = script
+        self.name = name
+        settings = transport_settings(name, port)
+        self.transport = settings["transport"]
+        self.host = settings["host"]
+        self.port = settings["port"]
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.next_restart_at = None
+
+    @property
+    def probe(self):
+        """Network servers are ready once their port accepts connections; stdio servers once they answer an MCP initialize."""
+        return "tcp" if self.transport in NETWORK_TRANSPORTS else "initialize"
+
+
+def run_script(server):
+    """Run a server script in a subprocess and store the process on the server."""
+    logger.debug(f"Checking if {server.script} exists")
+    if not os.path.exists(server.script):
+        logger.error(f"Error: {server.script} not found")
+        return None
     try:
-        logger.info(f"Starting {script_name}...")
-        process = subprocess.Popen([sys.executable, script_name], env=os.environ)
-        processes.append(process)
-        logger.debug(f"Started {script_name} with PID {process.pid}")
+        logger.info(f"Starting {server.script}...")
+        # stdio servers speak MCP over their stdin/stdout, which the readiness handshake uses
+        pipes = {"stdin": subprocess.PIPE, "stdout": subprocess.PIPE} if server.probe == "initialize" else {}
+        server.process = subprocess.Popen([sys.executable, server.script], env=os.environ, **pipes)
+        server.started_at = time.monotonic()
+        logger.debug(f"Started {server.script} with PID {server.process.pid}")
+        return server.process
     except Exception as e:
-        logger.error(f"Error starting {script_name}: {e}", exc_info=True)
+        logger.error(f"Error starting {server.script}: {e}", exc_info=True)
+        return None
+
+
+def send_message(process, message):
+    """Write one newline-delimited JSON-RPC message to a stdio server."""
+    process.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+    process.stdin.flush()
+
+
+def initialize_handshake(server, deadline):
+    """Complete an MCP initialize round-trip with a stdio server. Returns True once it answers."""
+    process = server.process
+    try:
+        send_message(process, {
+            "jsonrpc": "2.0", "id": 1, "method": "initialize",
+            "params": {
+                "protocolVersion": MCP_PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "main.py", "version": "1.0"},
+            },
+        })
+        while time.monotonic() < deadline:
+            readable, _, _ = select.select([process.stdout], [], [], 0.1)
+            if not readable:
+                if process.poll() is not None:
+                    return False
+                continue
+            line = process.stdout.readline()
+            if not line:
+                return False
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("id") == 1:
+                if "result" not in message:
+                    logger.error(f"{server.script} rejected the MCP initialize request: {message.get('error')}")
+                    return False
+                send_message(process, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+                return True
+    except OSError as e:
+        logger.error(f"MCP handshake with {server.script} failed: {e}")
+    return False
+
+
+def wait_until_ready(server, deadline):
+    """Poll one server until it is ready or the deadline passes. Returns seconds to ready, or None."""
+    while time.monotonic() < deadline:
+        if server.process is None or server.process.poll() is not None:
+            logger.error(f"{server.script} exited during startup")
+            return None
+        if server.probe == "tcp":
+            try:
+                with socket.create_connection((server.host, server.port), timeout=0.5):
+                    return time.monotonic() - server.started_at
+            except OSError:
+                pass
+        elif initialize_handshake(server, deadline):
+            return time.monotonic() - server.started_at
+        else:
+            logger.error(f"{server.script} did not answer the MCP initialize handshake")
+            return None
+        time.sleep(0.1)
+    logger.error(f"{server.script} was not ready within the startup deadline")
+    return None
+
+
+def wait_for_servers(servers, timeout):
+    """Probe every server in parallel and log a per-server startup timing report."""
+    deadline = time.monotonic() + timeout
+    with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+        timings = dict(zip(
+            [server.script for server in servers],
+            executor.map(lambda server: wait_until_ready(server, deadline), servers)
+        ))
+    logger.info(f"Startup timing report ({MCP_SERVER_MODE} mode):")
+    total_rss = 0.0
+    for server in servers:
+        elapsed = timings[server.script]
+        status = f"ready in {elapsed:.2f}s" if elapsed is not None else "NOT READY"
+        rss = resident_memory_mb(server.process.pid) if server.process is not None else None
+        total_rss += rss or 0
+        memory = f"{rss:.1f} MB" if rss is not None else "n/a"
+        logger.info(f"  {server.script:<24} {server.probe:<10} {status:<16} RSS {memory}")
+    ready = [elapsed for elapsed in timings.values() if elapsed is not None]
+    logger.info(
+        f"  {'total':<24} {'':<10} {f'ready in {max(ready):.2f}s' if ready else 'NOT READY':<16} "
+        f"RSS {total_rss:.1f} MB across {len(servers)} processes"
+    )
+    return all(elapsed is not None for elapsed in timings.values())
+
+
+def supervise(servers):
+    """Restart servers that have crashed, with exponential backoff between attempts."""
+    now = time.monotonic()
+    for server in servers:
+        if server.process is None or server.process.poll() is None:
+            continue
+        if server.restarts >= RESTART_MAX_ATTEMPTS:
+            continue
+        if server.next_restart_at is None:
+            delay = min(RESTART_BACKOFF_BASE * (2 ** server.restarts), RESTART_BACKOFF_MAX)
+            server.next_restart_at = now + delay
+            logger.warning(
+                f"{server.script} exited with code {server.process.returncode}, "
+                f"restarting in {delay:.1f}s (attempt {server.restarts + 1}/{RESTART_MAX_ATTEMPTS})"
+            )
+        elif now >= server.next_restart_at:
+            server.restarts += 1
+            server.next_restart_at = None
+            run_script(server)
+            if server.restarts >= RESTART_MAX_ATTEMPTS:
+                logger.error(f"{server.script} reached the restart limit and will not be restarted again")
+
+
+def stop_servers(servers):
+    for server in servers:
+        process = server.process
+        if process is None:
+            continue
+        logger.debug(f"Terminating process with PID {process.pid}")
+        process.terminate()  # Send SIGTERM
+        try:
+            process.wait(timeout=5)  # Wait for graceful shutdown
+            logger.info(f"Process with PID {process.pid} terminated gracefully")
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Process with PID {process.pid} did not terminate, force killing")
+            process.kill()  # Force kill if not terminated
+            logger.info(f"Force killed process with PID {process.pid}")
+    logger.info("All servers stopped.")
+
 
 if __name__ == "__main__":
     logger.info("Starting main.py")
-    # List of scripts
-    scripts = [
-        "reddit_mcp_server.py",
-        "twitter_mcp_server.py",
-        "serpapi_mcp_server.py",
-        "mcp_server.py"  # Proxy server
-    ]
-
-    # Store subprocesses for termination
-    processes = []
-
-    # Start all servers
-    for script in scripts:
-        run_script(script, processes)
-
-    # Wait for servers to initialize
-    logger.info("Waiting for servers to initialize...")
-    time.sleep(10)  # Adjust as needed
-    logger.debug("Finished waiting for server initialization")
-
-    # Run reddit_agent.py
-    try:
-        logger.info("Starting reddit_agent.py...")
-        agent_process = subprocess.Popen([sys.executable, "reddit_agent.py"], env=os.environ)
-        logger.debug(f"Started reddit_agent.py with PID {agent_process.pid}")
-        agent_process.wait()  # Wait for agent to complete
-        logger.info("reddit_agent.py completed")
-    except Exception as e:
-        logger.error(f"Error running reddit_agent.py: {e}", exc_info=True)
+    # Servers, with the environment prefix and default port used for their settings
+    if MCP_SERVER_MODE == "consolidated":
+        servers = [Server("consolidated_server.py", "CONSOLIDATED", 8010)]
+    else:
+        servers = [
+            Server("reddit_mcp_server.py", "REDDIT", 8001),
+            Server("twitter_mcp_server.py", "TWITTER", 8002),
+            Server("serpapi_mcp_server.py", "SERPAPI", 8003),
+            Server("mcp_server.py", "PROXY", 8000),  # Proxy server
+        ]
 
-    # Terminate servers on completion or interrupt
     try:
+        # Start all servers
+        for server in servers:
+            run_script(server)
+
+        # Wait for servers to initialize
+        logger.info(f"Waiting up to {STARTUP_DEADLINE}s for servers to become ready...")
+        if not wait_for_servers(servers, STARTUP_DEADLINE):
+            logger.error("Not all servers became ready, aborting")
+            stop_servers(servers)
+            sys.exit(1)
+
+        # Run reddit_agent.py
+        try:
+            logger.info("Starting reddit_agent.py...")
+            agent_process = subprocess.Popen([sys.executable, "reddit_agent.py"], env=os.environ)
+            logger.debug(f"Started reddit_agent.py with PID {agent_process.pid}")
+            # Wait for agent to complete, restarting any server that crashes meanwhile
+            while agent_process.poll() is None:
+                supervise(servers)
+                time.sleep(0.5)
+            logger.info("reddit_agent.py completed")
+        except Exception as e:
+            logger.error(f"Error running reddit_agent.py: {e}", exc_info=True)
+
+        # Terminate servers on completion
         logger.info("Shutting down servers...")
-        for process in processes:
-            logger.debug(f"Terminating process with PID {process.pid}")
-            process.terminate()  # Send SIGTERM
-            try:
-                process.wait(timeout=5)  # Wait for graceful shutdown
-                logger.info(f"Process with PID {process.pid} terminated gracefully")
-            except subprocess.TimeoutExpired:
-                logger.warning(f"Process with PID {process.pid} did not terminate, force killing")
-                process.kill()  # Force kill if not terminated
-                logger.info(f"Force killed process with PID {process.pid}")
-        logger.info("All servers stopped.")
+        stop_servers(servers)
     except KeyboardInterrupt:
         logger.warning("KeyboardInterrupt received, shutting down servers...")
-        for process in processes:
-            logger.debug(f"Terminating process with PID {process.pid} due to interrupt")
-            process.terminate()
-            try:
-                process.wait(timeout=5)
-                logger.info(f"Process with PID {process.pid} terminated gracefully")
-            except subprocess.TimeoutExpired:
-                logger.warning(f"Process with PID {process.pid} did not terminate, force killing")
-                process.kill()
-                logger.info(f"Force killed process with PID {process.pid}")
-        logger.info("All servers stopped.")
\ No newline at end of file
+        stop_servers(servers)
@@ -1,80 +1,365 @@
 # server.py
 
 from fastmcp import FastMCP
+from typing import List, Optional, Tuple
+import os
+import time
 import asyncio
 import httpx
 import json
-import logging
+from log_setup import log_payload, setup_logging
+from server_transport import run_server
+from http_pool import HTTPPool
+from response_cache import make_key
+from single_flight import SingleFlight
+from metrics import Metrics
+from dedup import collect_items, deduplicate
+from resilience import DEADLINE_HEADER, CircuitBreaker, CircuitOpenError, Hedger
+from output_format import encode, format_error
+from warehouse import Warehouse, parse_time
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/mcp_server.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = setup_logging("mcp_server")
+
+# Proxy endpoints for each server
+REDDIT_SERVER_URL = os.getenv("PROXY_REDDIT_URL", "http://localhost:8001")
+TWITTER_SERVER_URL = os.getenv("PROXY_TWITTER_URL", "http://localhost:8002")
+SERPAPI_SERVER_URL = os.getenv("PROXY_SERPAPI_URL", "http://localhost:8003")
+
+# One connection pool for the lifetime of the proxy, shared by all tools
+http_pool = HTTPPool("PROXY_HTTP", backends={"reddit": 60, "twitter": 30, "serpapi": 30})
+
+# Identical in-flight calls share one backend request
+single_flight = SingleFlight()
+
+# Fail fast while a backend is down, and optionally race slow requests (PROXY_HEDGE_*)
+breakers = {backend: CircuitBreaker(f"PROXY_{backend}") for backend in ("reddit", "twitter", "serpapi")}
+hedger = Hedger("PROXY")
+
+# Total time a proxied call may take, per tool: PROXY_DEADLINE_<TOOL>, else the backend's timeout
+DEFAULT_DEADLINES = {"fetch_posts_by_titles": 120, "fetch_tweets_by_keywords": 90}
+
+def deadline_for(tool: str, backend: str) -> float:
+    default = DEFAULT_DEADLINES.get(tool, http_pool.timeouts.get(backend, http_pool.default_timeout))
+    return float(os.getenv(f"PROXY_DEADLINE_{tool.upper()}", str(default)))
+
+# Read-only view of the results the source servers have stored locally
+warehouse = Warehouse(writer=False)
 
 logger.info("Creating MCP server")
-mcp = FastMCP("mcp-server")
+mcp = FastMCP("mcp-server", lifespan=http_pool.lifespan)
 
-# Proxy endpoints for each server
-REDDIT_SERVER_URL = "http://localhost:8001"
-TWITTER_SERVER_URL = "http://localhost:8002"
-SERPAPI_SERVER_URL = "http://localhost:8003"
+# Per-tool latency, backend timing and error counters
+metrics = Metrics("proxy")
+metrics.register("coalescing", single_flight.stats)
+metrics.register("hedging", hedger.stats)
+for _backend, _breaker in breakers.items():
+    metrics.register(f"breaker_{_backend}", _breaker.stats)
+metrics.install_http_endpoint(mcp)
+
+async def _post(backend: str, url: str, payload: dict, expires_at: float) -> Tuple[str, int, float]:
+    """
+    Send one request to a backend over the shared pool. Returns the body, the status
+    and when the attempt started, so that metrics count only the attempt that wins.
+    """
+    remaining = max(0.001, expires_at - time.monotonic())
+    logger.debug("Sending request to %s with %.2fs left", url, remaining)
+    started = time.perf_counter()
+    # Part of the REST contract, for backends that can stop work the proxy will no longer
+    # wait for; the MCP servers read the same header only on their own MCP endpoint
+    response = await http_pool.client.post(
+        url, json=payload, headers={DEADLINE_HEADER: str(int(remaining * 1000))},
+        timeout=httpx.Timeout(min(remaining, http_pool.timeouts.get(backend, http_pool.default_timeout)))
+    )
+    log_payload(logger, response.text, "Received response from %s server", backend)
+    response.raise_for_status()
+    return response.text, response.status_code, started
+
+def _is_backend_failure(error: BaseException) -> bool:
+    """Timeouts, connection errors and 5xx responses count against a backend's health; 4xx do not."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+async def _call_backend(tool: str, backend: str, url: str, payload: dict) -> str:
+    """One backend call under the tool's deadline, the backend's circuit breaker and optional hedging."""
+    deadline = deadline_for(tool, backend)
+    expires_at = time.monotonic() + deadline
+
+    async def attempt():
+        return await asyncio.wait_for(
+            hedger.run(backend, lambda: _post(backend, url, payload, expires_at)), timeout=deadline
+        )
+
+    started = time.perf_counter()
+    try:
+        body, status, attempt_started = await breakers[backend].call(attempt, _is_backend_failure)
+    except CircuitOpenError:
+        raise
+    except asyncio.TimeoutError:
+        metrics.record_upstream(backend, started, error="TimeoutError")
+        metrics.inc("deadline_exceeded_total", tool=tool, backend=backend)
+        raise TimeoutError(f"{tool} exceeded its {deadline}s deadline waiting for the {backend} backend")
+    except Exception as e:
+        metrics.record_upstream(backend, started, error=type(e).__name__)
+        if isinstance(e, httpx.HTTPStatusError):
+            metrics.upstream_status(backend, e.response.status_code)
+        raise
+    metrics.record_upstream(backend, attempt_started)
+    metrics.upstream_status(backend, status)
+    return body
+
+async def _proxy(tool: str, backend: str, url: str, payload: dict) -> str:
+    """Forward a tool call, sharing one upstream request between identical concurrent calls."""
+    key = make_key(tool, payload)
+    # make_key ignores `refresh`; a refreshing call must not join a request that may be served from cache
+    if payload.get("refresh"):
+        key += ":refresh"
+    return await single_flight.do(key, lambda: _call_backend(tool, backend, url, payload))
 
 @mcp.tool()
+@metrics.tool("fetch_posts_by_title")
 async def fetch_posts_by_title(
     title_keyword: str,
     sort: str = "hot",
-    limit: int = 3
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    incremental: bool = False,
+    comment_limit: int = 3,
+    comment_depth: int = 1,
+    comment_sort: str = "top"
 ) -> str:
-    logger.info(f"Proxying Reddit request for title_keyword: {title_keyword}, sort: {sort}, limit: {limit}")
-    async with httpx.AsyncClient() as client:
-        logger.debug(f"Sending request to {REDDIT_SERVER_URL}/fetch_posts_by_title")
-        response = await client.post(
-            f"{REDDIT_SERVER_URL}/fetch_posts_by_title",
-            json={"title_keyword": title_keyword, "sort": sort, "limit": limit}
-        )
-        logger.debug(f"Received response from Reddit server: {response.text}")
-        response.raise_for_status()
-        logger.info(f"Successfully proxied Reddit request for title_keyword: {title_keyword}")
-        return response.text
+    logger.info("Proxying Reddit request for title_keyword: %s, sort: %s, limit: %s", title_keyword, sort, limit)
+    result = await _proxy(
+        "fetch_posts_by_title", "reddit", f"{REDDIT_SERVER_URL}/fetch_posts_by_title",
+        {
+            "title_keyword": title_keyword, "sort": sort, "limit": limit, "refresh": refresh,
+            "output_format": output_format, "fields": fields, "max_text_length": max_text_length,
+            "incremental": incremental, "comment_limit": comment_limit,
+            "comment_depth": comment_depth, "comment_sort": comment_sort
+        }
+    )
+    logger.info("Successfully proxied Reddit request for title_keyword: %s", title_keyword)
+    return result
 
 @mcp.tool()
+@metrics.tool("fetch_tweets_by_keyword")
 async def fetch_tweets_by_keyword(
     keyword: str,
-    limit: int = 3
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    incremental: bool = False
 ) -> str:
-    logger.info(f"Proxying Twitter request for keyword: {keyword}, limit: {limit}")
-    async with httpx.AsyncClient() as client:
-        logger.debug(f"Sending request to {TWITTER_SERVER_URL}/fetch_tweets_by_keyword")
-        response = await client.post(
-            f"{TWITTER_SERVER_URL}/fetch_tweets_by_keyword",
-            json={"keyword": keyword, "limit": limit}
-        )
-        logger.debug(f"Received response from Twitter server: {response.text}")
-        response.raise_for_status()
-        logger.info(f"Successfully proxied Twitter request for keyword: {keyword}")
-        return response.text
+    logger.info("Proxying Twitter request for keyword: %s, limit: %s", keyword, limit)
+    result = await _proxy(
+        "fetch_tweets_by_keyword", "twitter", f"{TWITTER_SERVER_URL}/fetch_tweets_by_keyword",
+        {
+            "keyword": keyword, "limit": limit, "refresh": refresh,
+            "output_format": output_format, "fields": fields, "max_text_length": max_text_length,
+            "incremental": incremental
+        }
+    )
+    logger.info("Successfully proxied Twitter request for keyword: %s", keyword)
+    return result
+
+@mcp.tool()
+@metrics.tool("search")
+async def search(
+    params: dict,
+    limit: int = 3,
+    engines: Optional[List[str]] = None,
+    queries: Optional[List[str]] = None,
+    refresh: bool = False,
+    output_format: str = "text",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None
+) -> str:
+    logger.info("Proxying SerpAPI search request with params: %s, limit: %s", params, limit)
+    result = await _proxy(
+        "search", "serpapi", f"{SERPAPI_SERVER_URL}/search",
+        {
+            "params": params, "limit": limit, "engines": engines, "queries": queries, "refresh": refresh,
+            "output_format": output_format, "fields": fields, "max_text_length": max_text_length
+        }
+    )
+    logger.info("Successfully proxied SerpAPI search request")
+    return result
 
 @mcp.tool()
-async def search(params: dict, limit: int = 3) -> str:
-    logger.info(f"Proxying SerpAPI search request with params: {params}")
-    async with httpx.AsyncClient() as client:
-        logger.debug(f"Sending request to {SERPAPI_SERVER_URL}/search")
-        response = await client.post(
-            f"{SERPAPI_SERVER_URL}/search",
-            json=params
+@metrics.tool("fetch_posts_by_titles")
+async def fetch_posts_by_titles(
+    title_keywords: List[str],
+    sort: str = "hot",
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    comment_limit: int = 3,
+    comment_depth: int = 1,
+    comment_sort: str = "top"
+) -> str:
+    logger.info("Proxying batched Reddit request for %s keywords", len(title_keywords))
+    return await _proxy(
+        "fetch_posts_by_titles", "reddit", f"{REDDIT_SERVER_URL}/fetch_posts_by_titles",
+        {
+            "title_keywords": title_keywords, "sort": sort, "limit": limit, "refresh": refresh,
+            "output_format": output_format, "fields": fields, "max_text_length": max_text_length,
+            "comment_limit": comment_limit, "comment_depth": comment_depth, "comment_sort": comment_sort
+        }
+    )
+
+@mcp.tool()
+@metrics.tool("fetch_tweets_by_keywords")
+async def fetch_tweets_by_keywords(
+    keywords: List[str],
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None
+) -> str:
+    logger.info("Proxying batched Twitter request for %s keywords", len(keywords))
+    return await _proxy(
+        "fetch_tweets_by_keywords", "twitter", f"{TWITTER_SERVER_URL}/fetch_tweets_by_keywords",
+        {
+            "keywords": keywords, "limit": limit, "refresh": refresh,
+            "output_format": output_format, "fields": fields, "max_text_length": max_text_length
+        }
+    )
+
+def _parse(source: str, body) -> Optional[dict]:
+    """Decode a backend result for deduplication; failed or unparseable sources are skipped."""
+    if isinstance(body, Exception):
+        logger.warning("Skipping %s results for deduplication: %s", source, body)
+        return None
+    try:
+        result = json.loads(body)
+    except ValueError:
+        logger.warning("Skipping %s results for deduplication: response is not JSON", source)
+        return None
+    if "error" in result:
+        logger.warning("Skipping %s results for deduplication: %s", source, result["error"])
+        return None
+    return result
+
+@mcp.tool()
+@metrics.tool("fetch_deduplicated")
+async def fetch_deduplicated(
+    keyword: str,
+    limit: int = 3,
+    sort: str = "hot",
+    refresh: bool = False,
+    output_format: str = "json"
+) -> str:
+    """
+    Fetch Reddit posts, tweets and web results for a keyword concurrently and merge
+    items that point at the same page or carry near-identical text into clusters,
+    each with one representative.
+
+    Args:
+        keyword: Keyword to search on every source
+        limit: Items to fetch per source
+        sort: Reddit sort order (hot, new, top)
+        refresh: Skip the backends' response caches
+        output_format: json (indented), compact or msgpack (base64)
+    """
+    logger.info("Fetching deduplicated results for keyword: %s, limit: %s", keyword, limit)
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    common = {"refresh": refresh, "output_format": "compact", "fields": None, "max_text_length": None}
+    bodies = await asyncio.gather(
+        _proxy("fetch_posts_by_title", "reddit", f"{REDDIT_SERVER_URL}/fetch_posts_by_title",
+               {"title_keyword": keyword, "sort": sort, "limit": limit, "incremental": False, **common}),
+        _proxy("fetch_tweets_by_keyword", "twitter", f"{TWITTER_SERVER_URL}/fetch_tweets_by_keyword",
+               {"keyword": keyword, "limit": limit, "incremental": False, **common}),
+        _proxy("search", "serpapi", f"{SERPAPI_SERVER_URL}/search",
+               {"params": {"q": keyword}, "limit": limit, **common}),
+        return_exceptions=True
+    )
+    reddit, twitter, serpapi = (_parse(source, body) for source, body in zip(("reddit", "twitter", "serpapi"), bodies))
+    if reddit is None and twitter is None and serpapi is None:
+        return json.dumps({"error": f"All sources failed for keyword: {keyword}"}, indent=2)
+    result = deduplicate(collect_items(reddit, twitter, serpapi))
+    result["keyword"] = keyword
+    result["failed_sources"] = [
+        source for source, parsed in (("reddit", reddit), ("twitter", twitter), ("serpapi", serpapi)) if parsed is None
+    ]
+    logger.info(
+        "Merged %s items for keyword %s into %s clusters", result["input_count"], keyword, result["count"]
+    )
+    with metrics.phase("serialize"):
+        return encode(result, output_format)
+
+@mcp.tool()
+@metrics.tool("query_history")
+async def query_history(
+    text: Optional[str] = None,
+    source: Optional[str] = None,
+    keyword: Optional[str] = None,
+    kind: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    order: str = "recent",
+    limit: int = 20,
+    raw_query: bool = False,
+    output_format: str = "json"
+) -> str:
+    """
+    Search previously fetched posts, comments, tweets and web results in the local
+    warehouse, without calling any backend.
+
+    Args:
+        text: Phrase to search for in titles and bodies
+        source: Only items from reddit, twitter or serpapi
+        keyword: Only items fetched for this keyword
+        kind: Only items of this kind: post, comment, tweet or web
+        since: Earliest creation time, as epoch seconds or an ISO date
+        until: Latest creation time (exclusive), as epoch seconds or an ISO date
+        order: recent, score or, with text, relevance
+        limit: Maximum number of items to return
+        raw_query: Treat text as FTS5 query syntax (e.g. "NEAR(vector database)") instead of a phrase
+        output_format: json (indented), compact or msgpack (base64)
+    """
+    logger.info("Querying result history: text=%s, source=%s, keyword=%s", text, source, keyword)
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    try:
+        items = await asyncio.to_thread(
+            warehouse.query, text=text, source=source, keyword=keyword, kind=kind,
+            since=parse_time(since), until=parse_time(until), order=order, limit=limit, raw_query=raw_query
         )
-        logger.debug(f"Received response from SerpAPI server: {response.text}")
-        response.raise_for_status()
-        logger.info("Successfully proxied SerpAPI search request")
-        return response.text
+    except Exception as e:
+        logger.error("Failed to query result history: %s", e, exc_info=True)
+        return json.dumps({"error": f"Failed to query history: {str(e)}"}, indent=2)
+    with metrics.phase("serialize"):
+        return encode({"items": items, "count": len(items)}, output_format)
+
+@mcp.tool()
+async def proxy_stats() -> str:
+    """Return request coalescing, circuit breaker and hedging counters for the proxy."""
+    return json.dumps({
+        "coalescing": single_flight.stats(),
+        "breakers": {backend: breaker.stats() for backend, breaker in breakers.items()},
+        "hedging": hedger.stats(),
+    }, indent=2)
+
+@mcp.tool()
+async def get_metrics(format: str = "json") -> str:
+    """Return proxy metrics as a JSON summary or, with format="prometheus", Prometheus text."""
+    if format == "prometheus":
+        return metrics.render()
+    return json.dumps(metrics.snapshot(), indent=2)
 
 if __name__ == "__main__":
     logger.info("Starting MCP proxy server")
-    mcp.run()
+    run_server(mcp, "PROXY", 8000)
     logger.info("MCP server stopped")
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import atexit
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from resilience import request_deadline
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Phase intervals of the tool call running in the current task, shared with the tasks it spawns
+_current_call: contextvars.ContextVar = contextvars.ContextVar("metrics_current_call", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile: the upper bound of the bucket containing it."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, bound in enumerate(self.buckets):
+            seen += self.counts[index]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def covered_seconds(intervals: List[Tuple[float, float]]) -> float:
+    """
+    Wall-clock time covered by possibly overlapping (start, end) intervals, so that
+    concurrent upstream requests of one tool call are not counted several times.
+    """
+    total = 0.0
+    covered_until = float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            total += end - max(start, covered_until)
+            covered_until = end
+    return total
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    """
+    In-process metrics for one service: counters, histograms and gauges collected
+    from other components, rendered as Prometheus text or a JSON snapshot.
+
+    When METRICS_DUMP_PATH is set the Prometheus text is also written every
+    METRICS_DUMP_INTERVAL seconds (default 15) and on exit, to that path with the
+    service name added before the extension (metrics.prom -> metrics.reddit.prom),
+    so the processes started by main.py do not overwrite each other's dumps.
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.dump_path = os.getenv("METRICS_DUMP_PATH")
+        if self.dump_path:
+            root, extension = os.path.splitext(self.dump_path)
+            self.dump_path = f"{root}.{service}{extension}"
+        if self.dump_path:
+            self._start_dumper(float(os.getenv("METRICS_DUMP_INTERVAL", "15")))
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register(self, name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+        """Expose the numeric values returned by `collector()` as gauges named `<name>_<key>`."""
+        self._collectors[name] = collector
+
+    def tool(self, name: str):
+        """
+        Decorator for an async MCP tool: counts calls and records total latency, the
+        upstream/processing/serialization split and the response size.
+
+        A call whose caller sent a deadline header is abandoned once that deadline
+        passes, instead of running on after the caller has given up.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                phases = {"upstream": [], "serialize": []}
+                token = _current_call.set(phases)
+                started = time.perf_counter()
+                status = "ok"
+                deadline = request_deadline()
+                try:
+                    try:
+                        result = await asyncio.wait_for(fn(*args, **kwargs), timeout=deadline)
+                    except asyncio.TimeoutError:
+                        logger.warning("Abandoned %s after the caller's %.2fs deadline", name, deadline)
+                        self.inc("deadline_exceeded_total", tool=name)
+                        status = "deadline"
+                        return json.dumps({"error": f"{name} did not finish within the caller's deadline"}, indent=2)
+                    if isinstance(result, str):
+                        self.observe("tool_response_bytes", len(result.encode("utf-8")), SIZE_BUCKETS, tool=name)
+                        if result.startswith(("Error:", '{\n  "error"', '{"error"')):
+                            status = "error"
+                    return result
+                except Exception:
+                    status = "exception"
+                    raise
+                finally:
+                    _current_call.reset(token)
+                    elapsed = time.perf_counter() - started
+                    self.inc("tool_calls_total", tool=name, status=status)
+                    self.observe("tool_latency_seconds", elapsed, tool=name)
+                    upstream = covered_seconds(phases["upstream"])
+                    serialize = covered_seconds(phases["serialize"])
+                    self.observe("tool_phase_seconds", upstream, tool=name, phase="upstream")
+                    self.observe("tool_phase_seconds", serialize, tool=name, phase="serialize")
+                    processing = max(0.0, elapsed - upstream - serialize)
+                    self.observe("tool_phase_seconds", processing, tool=name, phase="process")
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def phase(self, phase: str):
+        """
+        Attribute the time spent in the block to a phase of the current tool call.
+        Overlapping blocks, such as concurrent upstream requests, count once.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_interval(phase, started)
+
+    @staticmethod
+    def _add_interval(phase: str, started: float) -> None:
+        phases = _current_call.get()
+        if phases is not None:
+            phases.setdefault(phase, []).append((started, time.perf_counter()))
+
+    @contextmanager
+    def upstream(self, upstream: str):
+        """Time one upstream API request; record its status with `upstream_status`."""
+        started = time.perf_counter()
+        try:
+            with self.phase("upstream"):
+                yield
+        except Exception as e:
+            self.inc("upstream_errors_total", upstream=upstream, error=type(e).__name__)
+            raise
+        finally:
+            self.observe("upstream_latency_seconds", time.perf_counter() - started, upstream=upstream)
+
+    def record_upstream(self, upstream: str, started: float, error: Optional[str] = None) -> None:
+        """
+        Record an upstream request that began at `started` (a perf_counter value) and
+        just ended, for callers that time attempts themselves, such as hedged requests
+        where only the winning attempt counts.
+        """
+        elapsed = time.perf_counter() - started
+        self._add_interval("upstream", started)
+        if error is not None:
+            self.inc("upstream_errors_total", upstream=upstream, error=error)
+        self.observe("upstream_latency_seconds", elapsed, upstream=upstream)
+
+    def upstream_status(self, upstream: str, status: int) -> None:
+        self.inc("upstream_responses_total", upstream=upstream, status=status)
+
+    def _gauges(self) -> Dict[str, float]:
+        gauges = {}
+        for name, collector in self._collectors.items():
+            try:
+                values = collector()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", name, e)
+                continue
+            for key, value in _flatten(values).items():
+                gauges[f"{name}_{key}"] = value
+        return gauges
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        for (name, labels), value in counters:
+            lines.append(f"{name}{_labels(dict(labels, service=self.service))} {value}")
+        for (name, labels), histogram in histograms:
+            labels = dict(labels, service=self.service)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"{name}{_labels({'service': self.service})} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly summary with counters, p50/p95/p99 per histogram and gauges."""
+        with self._lock:
+            counters = {
+                f"{name}{_labels(dict(labels))}": value for (name, labels), value in self._counters.items()
+            }
+            histograms = {
+                f"{name}{_labels(dict(labels))}": {
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in self._histograms.items()
+            }
+        return {"service": self.service, "counters": counters, "histograms": histograms, "gauges": self._gauges()}
+
+    def dump(self, path: Optional[str] = None) -> None:
+        path = path or self.dump_path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write(self.render())
+        os.replace(tmp_path, path)
+
+    def _start_dumper(self, interval: float) -> None:
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump()
+                except Exception as e:
+                    logger.warning("Failed to write metrics to %s: %s", self.dump_path, e)
+
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+        atexit.register(self.dump)
+
+    def install_http_endpoint(self, mcp, path: str = "/metrics") -> None:
+        """Serve the Prometheus text on `path` when the server runs on a network transport."""
+        if not hasattr(mcp, "custom_route"):
+            return
+
+        @mcp.custom_route(path, methods=["GET"])
+        async def metrics_endpoint(request):
+            from starlette.responses import PlainTextResponse
+            return PlainTextResponse(self.render(), media_type="text/plain; version=0.0.4")
+
+
+def resident_memory_mb(pid="self") -> Optional[float]:
+    """Resident memory of a process in MB (Linux only), or None when unavailable."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _flatten(values: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in values.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, bool):
+            flat[name] = float(value)
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}_"))
+    return flat
@@ -0,0 +1,115 @@
+import json
+import base64
+import importlib
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Supported values for a tool's `output_format` argument
+OUTPUT_FORMATS = ("json", "compact", "msgpack")
+
+# Free-text fields that `max_text_length` applies to
+TEXT_FIELDS = {"title", "selftext", "body", "text", "snippet"}
+
+
+def msgpack_available() -> bool:
+    """Whether the optional `msgpack` package can be imported."""
+    try:
+        importlib.import_module("msgpack")
+    except ImportError:
+        return False
+    return True
+
+
+def format_error(output_format: str, formats=OUTPUT_FORMATS) -> Optional[str]:
+    """
+    Error message for an unsupported `output_format`, or None when it is valid. Tools
+    check this before any other work, so a bad argument never costs an upstream call.
+    """
+    if output_format not in formats:
+        return f"Unsupported output_format '{output_format}', expected one of {', '.join(formats)}"
+    if output_format == "msgpack" and not msgpack_available():
+        # Answering in another format would break clients that decode MessagePack
+        return "output_format 'msgpack' needs the 'msgpack' package, which is not installed on this server"
+    return None
+
+
+def _field_tree(fields: List[str]) -> Dict[str, dict]:
+    """Turn dotted field paths like "author.username" into a nested lookup tree."""
+    tree: Dict[str, dict] = {}
+    for path in fields:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _project(value: Any, tree: Dict[str, dict]) -> Any:
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _project(value[key], subtree) if subtree else value[key]
+            for key, subtree in tree.items() if key in value
+        }
+    return value
+
+
+def project(items: List[dict], fields: Optional[List[str]]) -> List[dict]:
+    """Keep only the requested (dotted) fields of each item; all fields when `fields` is empty."""
+    if not fields:
+        return items
+    return _project(items, _field_tree(fields))
+
+
+def truncate_text(value: Any, max_length: Optional[int]) -> Any:
+    """Cut every free-text field longer than `max_length` characters, recursively."""
+    if not max_length:
+        return value
+    if isinstance(value, list):
+        return [truncate_text(item, max_length) for item in value]
+    if isinstance(value, dict):
+        truncated = {}
+        for key, item in value.items():
+            if key in TEXT_FIELDS and isinstance(item, str) and len(item) > max_length:
+                truncated[key] = item[:max_length] + "..."
+            else:
+                truncated[key] = truncate_text(item, max_length)
+        return truncated
+    return value
+
+
+def encode(result: Dict[str, Any], output_format: str = "json") -> str:
+    """
+    Serialize a tool result.
+
+    "json" is the indented default, "compact" drops all insignificant whitespace, and
+    "msgpack" returns base64-encoded MessagePack (requires the `msgpack` package).
+    """
+    if output_format == "compact":
+        return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
+    if output_format == "msgpack":
+        error = format_error(output_format)
+        if error:
+            raise ValueError(error)
+        import msgpack
+        return base64.b64encode(msgpack.packb(result, use_bin_type=True)).decode("ascii")
+    return json.dumps(result, indent=2)
+
+
+def render(
+    result: Dict[str, Any],
+    items_key: str,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None
+) -> str:
+    """Apply field projection and text truncation to `result[items_key]`, then encode the result."""
+    error = format_error(output_format)
+    if error:
+        raise ValueError(error)
+    if items_key in result and (fields or max_text_length):
+        result = dict(result)
+        result[items_key] = truncate_text(project(result[items_key], fields), max_text_length)
+    return encode(result, output_format)
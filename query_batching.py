@@ -0,0 +1,86 @@
+import re
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def keyword_clause(keyword: str) -> str:
+    """
+    One keyword as a clause of an OR query. Multi-word keywords are grouped so they
+    keep the same all-words-must-match meaning they have as a query of their own.
+    """
+    keyword = keyword.strip()
+    if " " in keyword and not (keyword.startswith('"') and keyword.endswith('"')):
+        return f"({keyword})"
+    return keyword
+
+
+def pack_keywords(keywords: Iterable[str], max_length: int, max_terms: Optional[int] = None) -> List[List[str]]:
+    """
+    Group keywords into as few OR queries as fit in `max_length` characters each
+    (and at most `max_terms` keywords per query). A keyword too long to share a
+    query gets one of its own.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    length = 0
+    for keyword in keywords:
+        clause = keyword_clause(keyword)
+        added = len(clause) + (len(" OR ") if current else 0)
+        if current and (length + added > max_length or (max_terms and len(current) >= max_terms)):
+            batches.append(current)
+            current, length, added = [], 0, len(clause)
+        current.append(keyword)
+        length += added
+    if current:
+        batches.append(current)
+    return batches
+
+
+def or_query(keywords: List[str]) -> str:
+    return " OR ".join(keyword_clause(keyword) for keyword in keywords)
+
+
+def keyword_matcher(keyword: str) -> Callable[[str], bool]:
+    """
+    Predicate telling whether a text matches a keyword: every word of the keyword
+    (or the exact phrase, for a quoted keyword) appears in it, ignoring case.
+    """
+    keyword = keyword.strip()
+    if keyword.startswith('"') and keyword.endswith('"') and len(keyword) > 1:
+        words = _WORD.findall(keyword.lower())
+        phrase = re.compile(r"\b" + r"\W+".join(re.escape(word) for word in words) + r"\b", re.IGNORECASE)
+        return lambda text: bool(phrase.search(text or ""))
+    words = set(_WORD.findall(keyword.lower()))
+    return lambda text: words <= set(_WORD.findall((text or "").lower()))
+
+
+def demultiplex(
+    items: List[dict],
+    keywords: List[str],
+    text_of: Callable[[dict], str],
+    limit: int
+) -> Dict[str, List[dict]]:
+    """
+    Assign each item of a combined search to every keyword it matches, keeping at
+    most `limit` items per keyword in their original order. Items matching no
+    keyword (the search engine matched on stemming or other fields) are dropped.
+    """
+    matchers = {keyword: keyword_matcher(keyword) for keyword in keywords}
+    assigned: Dict[str, List[dict]] = {keyword: [] for keyword in keywords}
+    unmatched = 0
+    for item in items:
+        text = text_of(item)
+        matched = False
+        for keyword, matches in matchers.items():
+            if matches(text):
+                matched = True
+                if len(assigned[keyword]) < limit:
+                    assigned[keyword].append(item)
+        unmatched += not matched
+    if unmatched:
+        logger.debug("%s of %s batched items matched no keyword", unmatched, len(items))
+    return assigned
@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableError(Exception):
+    """An upstream failure worth retrying, such as a 429 or a 5xx response."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
+
+
+def retry_after_from(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait before retrying, from Retry-After or a rate-limit reset header."""
+    retry_after = _header(headers, "retry-after")
+    if retry_after is not None:
+        return retry_after
+    # Twitter sends the reset as an epoch timestamp
+    reset_at = _header(headers, "x-rate-limit-reset")
+    if reset_at is not None:
+        return max(0.0, reset_at - time.time())
+    # Reddit sends the seconds remaining in the window
+    return _header(headers, "x-ratelimit-reset")
+
+
+class ResponseHeaders:
+    """
+    Remember the headers of the last HTTP response each thread received, for clients
+    such as PRAW that hide them behind their own request machinery. `session()`
+    returns a requests session whose response hook does the recording.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def hook(self, response: Any, *args: Any, **kwargs: Any) -> Any:
+        self._local.headers = response.headers
+        return response
+
+    def session(self) -> Any:
+        import requests
+        session = requests.Session()
+        session.hooks["response"].append(self.hook)
+        return session
+
+    def pop(self) -> Optional[Mapping[str, str]]:
+        """Headers of the current thread's last response since the previous pop, if any."""
+        headers = getattr(self._local, "headers", None)
+        self._local.headers = None
+        return headers
+
+
+class RateLimiter:
+    """
+    Token-bucket scheduler for one upstream API, shared by every tool call in a process.
+
+    Calls queue for a token instead of failing, the bucket shrinks to whatever the
+    upstream reports as remaining in the current window, and retryable failures are
+    retried with jittered exponential backoff. Settings come from the environment:
+
+        <NAME>_RATE_LIMIT_PER_SEC   steady request rate (default given by the server)
+        <NAME>_RATE_LIMIT_BURST     bucket size (default given by the server)
+        <NAME>_MAX_RETRIES          retries for 429/5xx responses (default 3)
+        RATE_LIMIT_BACKOFF_BASE     first backoff delay in seconds (default 1)
+        RATE_LIMIT_BACKOFF_MAX      longest backoff delay in seconds (default 60)
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        prefix = name.upper()
+        self.configured_rate = float(os.getenv(f"{prefix}_RATE_LIMIT_PER_SEC", str(rate)))
+        self.rate = self.configured_rate
+        self.capacity = float(os.getenv(f"{prefix}_RATE_LIMIT_BURST", str(burst)))
+        self.max_retries = int(os.getenv(f"{prefix}_MAX_RETRIES", "3"))
+        self.backoff_base = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1"))
+        self.backoff_max = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "60"))
+
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.remaining: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.queue_depth = 0
+        self.requests = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        """Wait in line until a token is available and the upstream is not throttling us."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self.queue_depth += 1
+        started = time.monotonic()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if self.blocked_until > now:
+                        await asyncio.sleep(self.blocked_until - now)
+                        continue
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.queue_depth -= 1
+            waited = time.monotonic() - started
+            self.requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def observe(self, remaining: Optional[float], reset_in: Optional[float]) -> None:
+        """Learn the upstream's view of the current window: requests left and seconds until it resets."""
+        if remaining is None:
+            return
+        self.remaining = remaining
+        now = time.monotonic()
+        if remaining < 1 and reset_in:
+            self.blocked_until = max(self.blocked_until, now + reset_in)
+            logger.warning("%s rate limit exhausted, pausing for %.1fs", self.name, reset_in)
+        elif reset_in:
+            # Spread what is left of the window evenly instead of bursting into a wall
+            self.rate = min(self.configured_rate, max(remaining / reset_in, 0.01))
+        else:
+            self.rate = self.configured_rate
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Learn from Twitter's x-rate-limit-* or Reddit's x-ratelimit-* response headers."""
+        remaining = _header(headers, "x-rate-limit-remaining", "x-ratelimit-remaining")
+        self.observe(remaining, retry_after_from(headers))
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Run `fn` under the rate limit, retrying RetryableError with backoff."""
+        attempt = 0
+        while True:
+            await self.acquire()
+            try:
+                return await fn(*args)
+            except RetryableError as e:
+                if attempt >= self.max_retries:
+                    logger.error("%s request failed after %s attempts: %s", self.name, attempt + 1, e)
+                    raise
+                delay = e.retry_after if e.retry_after is not None else self.backoff(attempt)
+                delay = min(delay, self.backoff_max)
+                if e.status == 429:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                attempt += 1
+                self.retries += 1
+                logger.warning("%s request failed (%s), retry %s/%s in %.2fs", self.name, e, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "upstream": self.name,
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "retries": self.retries,
+            "avg_wait": round(self.total_wait / self.requests, 4) if self.requests else 0.0,
+            "max_wait": round(self.max_wait, 4),
+            "rate_per_sec": round(self.rate, 4),
+            "tokens": round(min(self.capacity, self.tokens + (now - self.updated_at) * self.rate), 2),
+            "remaining": self.remaining,
+            "throttled_for": round(max(0.0, self.blocked_until - now), 2),
+        }
@@ -1,29 +1,70 @@
-from crewai import Agent, Task, Crew, Process, LLM
+from crewai import Agent, Task, Crew, Process
 from crewai_tools import MCPServerAdapter
 from mcp import StdioServerParameters
+from server_transport import client_params
+from resilience import DEADLINE_HEADER
 import os
 import sys
-import google.generativeai as genai
 from dotenv import load_dotenv
-import logging
+from log_setup import log_payload, setup_logging
+from metrics import Metrics
+from llm_cache import CachedLLM, PromptCache
 import json
+import time
+import argparse
+import asyncio
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/reddit_agent.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = setup_logging("reddit_agent", sys.stdout)
 
 load_dotenv()
 google1_api_key = os.getenv('GOOGLE_API_KEY')
 deepseek_api_key = os.getenv('DEEPSEE_API_KEY')
 google2_api_key = os.getenv('LINKEDIN_GOOGLE_API_KEY')
 
+# "sequential" runs the three research tasks one after another in a single Crew,
+# "parallel" fans them out as independent Crews and collects results as they finish,
+# "direct" calls the MCP tools straight away without an LLM deciding the arguments.
+CREW_PROCESS_MODE = os.getenv("CREW_PROCESS_MODE", "sequential").lower()
+# Seconds each research task (or direct tool call) may take before it is abandoned
+CREW_TASK_DEADLINE = float(os.getenv("CREW_TASK_DEADLINE", "180"))
+# Feed the parallel or direct results into a final aggregation step
+CREW_AGGREGATE = os.getenv("CREW_AGGREGATE", "false").lower() in ("1", "true", "yes")
+
+# Tool arguments used by direct mode
+DIRECT_FETCH_LIMIT = int(os.getenv("DIRECT_FETCH_LIMIT", "3"))
+DIRECT_REDDIT_SORT = os.getenv("DIRECT_REDDIT_SORT", "hot")
+DIRECT_MAX_TEXT_LENGTH = int(os.getenv("DIRECT_MAX_TEXT_LENGTH", "0")) or None
+
+# The one fetch tool each source's agent is given, and the arguments direct mode calls it with
+DIRECT_TOOL_CALLS = {
+    "reddit": ("fetch_posts_by_title", lambda keyword: {
+        "title_keyword": keyword, "sort": DIRECT_REDDIT_SORT, "limit": DIRECT_FETCH_LIMIT,
+        "output_format": "compact", "max_text_length": DIRECT_MAX_TEXT_LENGTH,
+    }),
+    "serpapi": ("search", lambda keyword: {
+        "params": {"q": keyword}, "limit": DIRECT_FETCH_LIMIT,
+        "output_format": "compact", "max_text_length": DIRECT_MAX_TEXT_LENGTH,
+    }),
+    "twitter": ("fetch_tweets_by_keyword", lambda keyword: {
+        "keyword": keyword, "limit": DIRECT_FETCH_LIMIT,
+        "output_format": "compact", "max_text_length": DIRECT_MAX_TEXT_LENGTH,
+    }),
+}
+
+# "consolidated" connects to the single server that mounts every source's tools under a
+# "<source>_" prefix, instead of one server per source
+MCP_SERVER_MODE = os.getenv("MCP_SERVER_MODE", "multi").lower()
+
+# Per-task timing of crew runs, written to METRICS_DUMP_PATH on exit when set
+agent_metrics = Metrics("reddit_agent")
+
+# Completions for prompts already sent on an earlier or resumed run are served from disk
+llm_cache = PromptCache()
+agent_metrics.register("llm_cache", llm_cache.stats)
+
 # Automate server_params for each server
 script_dir = os.path.dirname(os.path.abspath(__file__))
 python_executable = sys.executable
@@ -43,14 +84,312 @@ server_params_serpapi = StdioServerParameters(
     args=[os.path.join(script_dir, "serpapi_mcp_server.py")],
     env={"UV_PYTHON": "3.11", **os.environ},
 )
+server_params_consolidated = StdioServerParameters(
+    command=python_executable,
+    args=[os.path.join(script_dir, "consolidated_server.py")],
+    env={"UV_PYTHON": "3.11", **os.environ},
+)
+
+class TaskTimer:
+    """Crew task_callback that records how long each task of a sequential run took."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.timings = {}
+        self.last = time.monotonic()
+
+    def __call__(self, output):
+        now = time.monotonic()
+        index = len(self.timings)
+        name = self.names[index] if index < len(self.names) else f"task_{index}"
+        self.timings[name] = round(now - self.last, 3)
+        agent_metrics.observe("crew_task_seconds", now - self.last, task=name, status="ok")
+        self.last = now
+
+async def run_task_with_deadline(name, agent, task, inputs, deadline, executor):
+    """Run a single research task in its own Crew, giving up after `deadline` seconds."""
+    crew = Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=True).copy()
+    started = time.monotonic()
+    try:
+        # kickoff is blocking, so it runs in a worker thread. On timeout the thread is
+        # left to finish in the background, but the run no longer waits for it.
+        loop = asyncio.get_running_loop()
+        result = await asyncio.wait_for(
+            loop.run_in_executor(executor, lambda: crew.kickoff(inputs=inputs)),
+            timeout=deadline
+        )
+        elapsed = time.monotonic() - started
+        logger.info("Task %s completed in %.2fs", name, elapsed)
+        agent_metrics.observe("crew_task_seconds", elapsed, task=name, status="ok")
+        return name, {"status": "ok", "output": str(result), "elapsed": elapsed}
+    except asyncio.TimeoutError:
+        logger.warning("Task %s exceeded its %ss deadline", name, deadline)
+        agent_metrics.observe("crew_task_seconds", time.monotonic() - started, task=name, status="timeout")
+        return name, {"status": "timeout", "output": None, "elapsed": time.monotonic() - started}
+    except Exception as e:
+        logger.error("Task %s failed: %s", name, e, exc_info=True)
+        agent_metrics.observe("crew_task_seconds", time.monotonic() - started, task=name, status="error")
+        return name, {"status": "error", "output": None, "error": str(e), "elapsed": time.monotonic() - started}
+
+async def run_parallel(named_tasks, inputs, deadline):
+    """Fan out the research tasks concurrently and collect results as they finish."""
+    # A dedicated pool (rather than the loop's default executor) so that timed-out
+    # tasks do not hold up asyncio.run() while it shuts down.
+    executor = ThreadPoolExecutor(max_workers=len(named_tasks), thread_name_prefix="crew-task")
+    pending = [
+        asyncio.create_task(run_task_with_deadline(name, agent, task, inputs, deadline, executor))
+        for name, agent, task in named_tasks
+    ]
+    results = {}
+    try:
+        for finished in asyncio.as_completed(pending):
+            name, outcome = await finished
+            results[name] = outcome
+            logger.info("Collected %s result with status %s", name, outcome['status'])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+async def call_tool_with_deadline(name, tool, arguments, deadline, executor):
+    """Call one MCP tool directly, giving up after `deadline` seconds."""
+    started = time.monotonic()
+    try:
+        loop = asyncio.get_running_loop()
+        result = await asyncio.wait_for(
+            loop.run_in_executor(executor, lambda: tool.run(**arguments)),
+            timeout=deadline
+        )
+        elapsed = time.monotonic() - started
+        output = str(result)
+        status = "error" if output.startswith(("Error:", '{\n  "error"', '{"error"')) else "ok"
+        logger.info("Direct fetch %s finished with status %s in %.2fs", name, status, elapsed)
+        agent_metrics.observe("direct_fetch_seconds", elapsed, source=name, status=status)
+        return name, {"status": status, "output": output, "elapsed": elapsed}
+    except asyncio.TimeoutError:
+        logger.warning("Direct fetch %s exceeded its %ss deadline", name, deadline)
+        agent_metrics.observe("direct_fetch_seconds", time.monotonic() - started, source=name, status="timeout")
+        return name, {"status": "timeout", "output": None, "elapsed": time.monotonic() - started}
+    except Exception as e:
+        logger.error("Direct fetch %s failed: %s", name, e, exc_info=True)
+        agent_metrics.observe("direct_fetch_seconds", time.monotonic() - started, source=name, status="error")
+        return name, {"status": "error", "output": None, "error": str(e), "elapsed": time.monotonic() - started}
+
+def fetch_tools(tools, name):
+    """The fetch tool of source `name` among an MCP server's tools, as a list for an Agent."""
+    tool_name = DIRECT_TOOL_CALLS[name][0]
+    # Tools of the consolidated server carry their source as a prefix
+    return [tool for tool in tools if tool.name in (tool_name, f"{name}_{tool_name}")]
+
+async def run_direct(named_tasks, keyword, deadline):
+    """Call every source's MCP tool concurrently with the keyword, without any LLM round trip."""
+    calls = []
+    for name, agent, _ in named_tasks:
+        tool_name, make_arguments = DIRECT_TOOL_CALLS[name]
+        tools = fetch_tools(agent.tools, name)
+        if not tools:
+            raise RuntimeError(f"Tool {tool_name} is not available for {name}")
+        calls.append((name, tools[0], make_arguments(keyword)))
+    executor = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="direct-fetch")
+    pending = [
+        asyncio.create_task(call_tool_with_deadline(name, tool, arguments, deadline, executor))
+        for name, tool, arguments in calls
+    ]
+    results = {}
+    try:
+        for finished in asyncio.as_completed(pending):
+            name, outcome = await finished
+            results[name] = outcome
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def aggregate_results(results, keyword, llm):
+    """Summarize the per-source results into one report with a final Crew step."""
+    sources = "\n\n".join(
+        f"## {name}\n{outcome['output']}"
+        for name, outcome in results.items() if outcome["status"] == "ok"
+    )
+    aggregator = Agent(
+        role="Research Aggregator",
+        goal="Combine findings from Reddit, web search and Twitter into one report.",
+        backstory="You merge research from several sources, removing overlap and highlighting key themes.",
+        llm=llm
+    )
+    aggregate_task = Task(
+        description=f"Combine the following research results for the keyword '{keyword}' into a single report:\n\n{sources}",
+        expected_output="A JSON string summarizing the combined findings across all sources.",
+        agent=aggregator
+    )
+    crew = Crew(agents=[aggregator], tasks=[aggregate_task], process=Process.sequential, verbose=True)
+    return crew.kickoff()
+
+def run_keyword(keyword, named_tasks, aggregate_llm=None):
+    """
+    Run the research tasks for one keyword and return a JSON-serializable record.
+    `aggregate_llm` runs the optional aggregation step (default: the first agent's LLM).
+    """
+    # Ensure inputs are properly formatted
+    inputs = {"title_keyword": keyword, "keyword": keyword}
+    log_payload(logger, inputs, "Prepared inputs for Crew.kickoff")
+    started = time.monotonic()
+    record = {"keyword": keyword, "mode": CREW_PROCESS_MODE}
+
+    if CREW_PROCESS_MODE in ("parallel", "direct"):
+        if CREW_PROCESS_MODE == "direct":
+            logger.info("Starting direct fetch with a %ss per-source deadline", CREW_TASK_DEADLINE)
+            results = asyncio.run(run_direct(named_tasks, keyword, CREW_TASK_DEADLINE))
+            logger.info("Direct fetch completed in %.2fs", time.monotonic() - started)
+            agent_metrics.observe("time_to_data_seconds", time.monotonic() - started, mode=CREW_PROCESS_MODE)
+        else:
+            logger.info("Starting parallel crew execution with a %ss per-task deadline", CREW_TASK_DEADLINE)
+            results = asyncio.run(run_parallel(named_tasks, inputs, CREW_TASK_DEADLINE))
+            logger.info("Parallel crew execution completed in %.2fs", time.monotonic() - started)
+        record["results"] = results
+        record["sources"] = {name: outcome["status"] for name, outcome in results.items()}
+        succeeded = sum(status == "ok" for status in record["sources"].values())
+        record["status"] = "ok" if succeeded == len(results) else "partial" if succeeded else "error"
+        record["timings"] = {name: round(outcome["elapsed"], 3) for name, outcome in results.items()}
+        if CREW_AGGREGATE:
+            logger.info("Starting aggregation step")
+            try:
+                aggregate_started = time.monotonic()
+                record["aggregate"] = str(aggregate_results(results, keyword, aggregate_llm or named_tasks[0][1].llm))
+                record["timings"]["aggregate"] = round(time.monotonic() - aggregate_started, 3)
+                agent_metrics.observe("crew_task_seconds", time.monotonic() - aggregate_started, task="aggregate", status="ok")
+            except Exception as e:
+                logger.error("Error during aggregation: %s", e, exc_info=True)
+                raise
+    else:
+        # Create and run crew. Each run works on a copy so keywords can run side by side
+        # while sharing the same agents' tools and MCP connections.
+        logger.debug("Creating Crew")
+        crew = Crew(
+            agents=[agent for _, agent, _ in named_tasks],
+            tasks=[task for _, _, task in named_tasks],
+            process=Process.sequential,
+            verbose=True
+        ).copy()
+        timer = TaskTimer(name for name, _, _ in named_tasks)
+        crew.task_callback = timer
+
+        logger.info("Starting crew execution")
+        try:
+            timer.last = time.monotonic()
+            result = crew.kickoff(inputs=inputs)
+            logger.info("Crew execution completed")
+        except Exception as e:
+            logger.error("Error during Crew.kickoff: %s", e, exc_info=True)
+            raise
+        record["result"] = str(result)
+        record["sources"] = {name: "ok" for name, _, _ in named_tasks}
+        record["status"] = "ok"
+        record["timings"] = timer.timings
+
+    record["elapsed"] = round(time.monotonic() - started, 3)
+    agent_metrics.observe("crew_kickoff_seconds", record["elapsed"], mode=CREW_PROCESS_MODE)
+    logger.info("Task timings for '%s': %s (total %ss)", keyword, json.dumps(record['timings']), record['elapsed'])
+    return record
+
+def read_keywords(source):
+    """Read one keyword per line from a file, or from stdin when source is '-'."""
+    handle = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        keywords = []
+        for line in handle:
+            keyword = line.strip()
+            if keyword and not keyword.startswith("#") and keyword not in keywords:
+                keywords.append(keyword)
+        return keywords
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def completed_keywords(output_path):
+    """Keywords whose every source succeeded in a record of the output file; "partial" ones are retried."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            # Records written before per-source statuses carry them in their results
+            sources = record.get("sources") or {
+                name: outcome.get("status") for name, outcome in (record.get("results") or {}).items()
+            }
+            if record.get("status") == "ok" and all(status == "ok" for status in sources.values()):
+                done.add(record.get("keyword"))
+    return done
+
+async def run_batch(keywords, named_tasks, output_path, concurrency, resume=True, aggregate_llm=None):
+    """Run many keywords with bounded concurrency, appending each result to a JSONL file as it completes."""
+    if resume:
+        done = completed_keywords(output_path)
+        if done:
+            logger.info("Skipping %s keywords already completed in %s", len(done), output_path)
+        keywords = [keyword for keyword in keywords if keyword not in done]
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    loop = asyncio.get_running_loop()
+
+    async def run_one(keyword):
+        try:
+            return await loop.run_in_executor(executor, run_keyword, keyword, named_tasks, aggregate_llm)
+        except Exception as e:
+            return {"keyword": keyword, "status": "error", "error": str(e)}
+
+    completed = 0
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            for finished in asyncio.as_completed([run_one(keyword) for keyword in keywords]):
+                record = await finished
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                completed += 1
+                logger.info("Batch progress %s/%s: %s -> %s", completed, len(keywords), record['keyword'], record['status'])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("Batch run finished, results written to %s", output_path)
+
+parser = argparse.ArgumentParser(description="Research a keyword across Reddit, web search and Twitter.")
+parser.add_argument("--batch", metavar="FILE", help="Run every keyword in FILE (one per line, '-' for stdin)")
+parser.add_argument("--output", default=os.path.join("results", "batch_results.jsonl"),
+                    help="JSONL file that batch results are appended to")
+parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                    help="Number of keywords processed at the same time in batch mode")
+parser.add_argument("--no-resume", action="store_true",
+                    help="Re-run keywords that already completed in the output file")
+args = parser.parse_args()
 
 try:
     logger.info("Starting reddit_agent.py")
     # Connect to MCP servers
-    with MCPServerAdapter(server_params_reddit) as reddit_tools, \
-         MCPServerAdapter(server_params_twitter) as twitter_tools, \
-         MCPServerAdapter(server_params_serpapi) as serpapi_tools:
-        logger.info(f"Loaded tools: {[tool.name for tool in reddit_tools + twitter_tools + serpapi_tools]}")
+    # Persistent servers on a network transport are reused; stdio copies are the fallback
+    # Networked servers abandon a tool call once the agent has stopped waiting for it
+    deadline_headers = {DEADLINE_HEADER: str(int(CREW_TASK_DEADLINE * 1000))}
+    with ExitStack() as stack:
+        if MCP_SERVER_MODE == "consolidated":
+            tools = stack.enter_context(MCPServerAdapter(
+                client_params("CONSOLIDATED", 8010, server_params_consolidated, deadline_headers)
+            ))
+            reddit_tools = twitter_tools = serpapi_tools = tools
+        else:
+            reddit_tools = stack.enter_context(MCPServerAdapter(client_params("REDDIT", 8001, server_params_reddit, deadline_headers)))
+            twitter_tools = stack.enter_context(MCPServerAdapter(client_params("TWITTER", 8002, server_params_twitter, deadline_headers)))
+            serpapi_tools = stack.enter_context(MCPServerAdapter(client_params("SERPAPI", 8003, server_params_serpapi, deadline_headers)))
+        # Each agent only sees the fetch tool its task needs; stats, admin and batched tools would
+        # lengthen every prompt and invite calls that do not fetch anything
+        reddit_tools = fetch_tools(reddit_tools, "reddit")
+        twitter_tools = fetch_tools(twitter_tools, "twitter")
+        serpapi_tools = fetch_tools(serpapi_tools, "serpapi")
+        logger.info("Loaded tools: %s", [tool.name for tool in reddit_tools + twitter_tools + serpapi_tools])
 
         # Define agents
         logger.debug("Defining Reddit agent")
@@ -60,8 +399,9 @@ try:
             backstory="You use Reddit tools to search for posts and comments matching a given title keyword across all subreddits.",
             tools=reddit_tools,
             # verbose=True,
-            llm=LLM(model='gemini/gemini-2.5-flash-preview-05-20', 
-                    api_key=os.getenv("GOOGLE_API_KEY"))
+            llm=CachedLLM(model='gemini/gemini-2.5-flash-preview-05-20',
+                          api_key=os.getenv("GOOGLE_API_KEY"),
+                          cache=llm_cache, agent_name="reddit")
         )
 
         logger.debug("Defining SerpApi agent")
@@ -71,8 +411,9 @@ try:
             backstory="You use SerpApi tools to retrieve relevant web search results for a given keyword.",
             tools=serpapi_tools,
             # verbose=True,
-            llm=LLM(model='gemini/gemini-2.5-flash-preview-05-20',
-                     api_key=os.getenv("LINKEDIN_GOOGLE_API_KEY"))
+            llm=CachedLLM(model='gemini/gemini-2.5-flash-preview-05-20',
+                          api_key=os.getenv("LINKEDIN_GOOGLE_API_KEY"),
+                          cache=llm_cache, agent_name="serpapi")
         )
 
         logger.debug("Defining Twitter agent")
@@ -82,9 +423,10 @@ try:
             backstory="You use Twitter tools to retrieve tweets matching a given keyword.",
             tools=twitter_tools,
             # verbose=True,
-            llm=LLM(model="deepseek-chat",
-                    api_key=os.getenv("DEEPSEE_API_KEY"), 
-                    base_url="https://api.deepseek.com")
+            llm=CachedLLM(model="deepseek-chat",
+                          api_key=os.getenv("DEEPSEE_API_KEY"),
+                          base_url="https://api.deepseek.com",
+                          cache=llm_cache, agent_name="twitter")
         )
 
         # Define tasks
@@ -109,34 +451,36 @@ try:
             agent=twitter_agent
         )
 
-        # Create and run crew
-        logger.debug("Creating Crew")
-        crew = Crew(
-            agents=[reddit_agent, serpapi_agent, twitter_agent],
-            tasks=[reddit_task, serpapi_task, twitter_task],
-            process=Process.sequential,
-            verbose=True
-        )
+        # The aggregation step has its own name, so LLM_CACHE_OPT_OUT=aggregate applies to it alone
+        aggregate_llm = CachedLLM(model='gemini/gemini-2.5-flash-preview-05-20',
+                                  api_key=os.getenv("GOOGLE_API_KEY"),
+                                  cache=llm_cache, agent_name="aggregate")
 
-        # Get keyword dynamically from user input
-        logger.info("Prompting for keyword input")
-        keyword = input("Enter the keyword to search: ").strip()
-        logger.info(f"Received keyword: {keyword}")
+        named_tasks = [
+            ("reddit", reddit_agent, reddit_task),
+            ("serpapi", serpapi_agent, serpapi_task),
+            ("twitter", twitter_agent, twitter_task),
+        ]
 
-        # Ensure inputs are properly formatted
-        inputs = {"title_keyword": keyword, "keyword": keyword}
-        logger.debug(f"Prepared inputs for Crew.kickoff: {json.dumps(inputs, indent=2)}")
+        if args.batch:
+            keywords = read_keywords(args.batch)
+            logger.info("Starting batch run of %s keywords with concurrency %s", len(keywords), args.concurrency)
+            asyncio.run(run_batch(
+                keywords, named_tasks, args.output, args.concurrency,
+                resume=not args.no_resume, aggregate_llm=aggregate_llm
+            ))
+        else:
+            # Get keyword dynamically from user input
+            logger.info("Prompting for keyword input")
+            keyword = input("Enter the keyword to search: ").strip()
+            logger.info("Received keyword: %s", keyword)
 
-        logger.info("Starting crew execution")
-        try:
-            result = crew.kickoff(inputs=inputs)
-            logger.info("Crew execution completed")
+            record = run_keyword(keyword, named_tasks, aggregate_llm)
             logger.info("\nFinal Result:")
-            logger.info(result)
-        except Exception as e:
-            logger.error(f"Error during Crew.kickoff: {e}", exc_info=True)
-            raise
+            logger.info(json.dumps(record, indent=2))
 
 except Exception as e:
-    logger.error(f"Error in reddit_agent.py: {e}", exc_info=True)
-    raise
\ No newline at end of file
+    logger.error("Error in reddit_agent.py: %s", e, exc_info=True)
+    raise
+finally:
+    logger.info("LLM cache stats: %s", json.dumps(llm_cache.stats()))
@@ -2,21 +2,28 @@
 
 import os
 import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastmcp import FastMCP
-import praw
 from dotenv import load_dotenv
-import logging
+from log_setup import setup_logging
+from server_transport import run_server
+from typing import TYPE_CHECKING, List, Optional
+from response_cache import ResponseCache, make_key
+from output_format import encode, format_error, project, render, truncate_text
+from metrics import Metrics
+from watermarks import WatermarkStore
+from warehouse import Warehouse
+from query_batching import demultiplex, or_query, pack_keywords
+from rate_limit import RateLimiter, ResponseHeaders, RetryableError, retry_after_from
+
+if TYPE_CHECKING:
+    # Only for annotations; PRAW itself is imported on the first Reddit call
+    import praw
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/reddit_mcp_server.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = setup_logging("reddit_mcp_server")
 
 load_dotenv()
 
@@ -25,19 +32,188 @@ logger.debug("Loading Reddit environment variables")
 REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "AIInsightAgent/1.0")
+# Alternative API hosts, e.g. local stand-ins used by the benchmark harness
+REDDIT_OAUTH_URL = os.getenv("REDDIT_OAUTH_URL", "https://oauth.reddit.com")
+REDDIT_URL = os.getenv("REDDIT_URL", "https://www.reddit.com")
+
+# PRAW is synchronous, so all Reddit calls run on a bounded worker pool instead
+# of the event loop. REDDIT_MAX_WORKERS caps concurrent Reddit round trips.
+REDDIT_MAX_WORKERS = int(os.getenv("REDDIT_MAX_WORKERS", "8"))
+reddit_executor = ThreadPoolExecutor(max_workers=REDDIT_MAX_WORKERS, thread_name_prefix="reddit")
+reddit_semaphore = asyncio.Semaphore(REDDIT_MAX_WORKERS)
+
+# OAuth clients may make 100 requests per minute
+rate_limiter = RateLimiter("reddit", rate=1.5, burst=10)
+# Reddit's x-ratelimit-* headers, captured per worker thread from PRAW's HTTP session
+reddit_headers = ResponseHeaders()
+
+# Longest search query Reddit accepts, and the most results one search returns
+REDDIT_QUERY_MAX_LENGTH = int(os.getenv("REDDIT_QUERY_MAX_LENGTH", "512"))
+REDDIT_SEARCH_MAX_LIMIT = 100
+
+# Newest post seen per keyword, for incremental fetching
+watermarks = WatermarkStore()
+
+# Local history of every fetched post and comment
+warehouse = Warehouse()
+
+# PRAW instances are not thread-safe, so each worker thread gets its own client.
+_thread_local = threading.local()
+
+def get_reddit() -> "praw.Reddit":
+    """Return the Reddit client owned by the current worker thread."""
+    client = getattr(_thread_local, "reddit", None)
+    if client is None:
+        # PRAW is slow to import, so it is loaded on the first Reddit call rather than at startup
+        import praw
+        client = praw.Reddit(
+            client_id=REDDIT_CLIENT_ID,
+            client_secret=REDDIT_CLIENT_SECRET,
+            user_agent=REDDIT_USER_AGENT,
+            oauth_url=REDDIT_OAUTH_URL,
+            reddit_url=REDDIT_URL,
+            requestor_kwargs={"session": reddit_headers.session()},
+        )
+        _thread_local.reddit = client
+    return client
+
+def _call_with_limits(func, *args):
+    """Run a PRAW call on the current worker thread and return its result with the last response's headers."""
+    import prawcore
+    reddit_headers.pop()
+    try:
+        result = func(*args)
+    except prawcore.exceptions.TooManyRequests as e:
+        raise RetryableError("Reddit API returned 429", status=429, retry_after=retry_after_from(e.response.headers))
+    except prawcore.exceptions.ServerError as e:
+        raise RetryableError(f"Reddit API returned {e.response.status_code}", status=e.response.status_code)
+    # PRAW's auth.limits lacks the reset time on PRAW 8, so read the headers themselves
+    return result, reddit_headers.pop()
+
+async def _run_in_pool(func, *args):
+    async with reddit_semaphore:
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.upstream("reddit"):
+                result, headers = await loop.run_in_executor(reddit_executor, _call_with_limits, func, *args)
+        except RetryableError as e:
+            metrics.upstream_status("reddit", e.status)
+            raise
+    metrics.upstream_status("reddit", 200)
+    if headers is not None:
+        rate_limiter.observe_headers(headers)
+    return result
 
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID,
-    client_secret=REDDIT_CLIENT_SECRET,
-    user_agent=REDDIT_USER_AGENT,
-)
+async def run_blocking(func, *args):
+    """Run a blocking PRAW call on the worker pool, under the rate limiter, without holding the event loop."""
+    return await rate_limiter.call(_run_in_pool, func, *args)
+
+def _search_posts(title_keyword: str, sort: str, limit: int, since: Optional[float] = None) -> list:
+    """
+    Run the Reddit search and return post dicts without comments.
+
+    With `since`, a search over the "new" listing, which is in creation order, stops
+    at the first post created at or before that time.
+    """
+    posts = []
+    for submission in get_reddit().subreddit("all").search(f"{title_keyword}", sort=sort, limit=limit):
+        if since is not None and submission.created_utc <= since and sort == "new":
+            break
+        logger.debug("Processing Reddit post: %s", submission.id)
+        posts.append({
+            "id": submission.id,
+            "title": submission.title,
+            "subreddit": submission.subreddit.display_name,
+            "author": str(submission.author) if submission.author else "[deleted]",
+            "score": submission.score,
+            "num_comments": submission.num_comments,
+            "created_utc": submission.created_utc,
+            "url": submission.url,
+            "selftext": submission.selftext,
+            "permalink": f"https://reddit.com{submission.permalink}"
+        })
+    return posts
+
+# Reddit's comment sorts; "top" returns the highest scored first
+COMMENT_SORTS = ("confidence", "top", "new", "controversial", "old", "qa")
+# Upper bound on comments requested per submission
+COMMENT_REQUEST_MAX = 100
+
+def _fetch_comments(submission_id: str, count: int = 3, depth: int = 1, sort: str = "top") -> list:
+    """
+    Fetch the `count` highest scored comments of a submission, down to `depth` reply levels.
+
+    Reddit is asked for a small, already sorted and depth-limited slice of the thread
+    in one request; "load more" stubs are skipped rather than expanded.
+    """
+    from praw.models import MoreComments
+    request_limit = min(COMMENT_REQUEST_MAX, count * max(depth, 1))
+    listings = get_reddit().get(
+        f"comments/{submission_id}", params={"sort": sort, "limit": request_limit, "depth": depth}
+    )
+    comments = []
+    stack = [(comment, 0) for comment in listings[1].children]
+    while stack:
+        comment, level = stack.pop()
+        if isinstance(comment, MoreComments):
+            continue
+        comments.append({
+            "id": comment.id,
+            "author": str(comment.author) if comment.author else "[deleted]",
+            "body": comment.body,
+            "score": comment.score,
+            "depth": level,
+            "parent_id": comment.parent_id,
+            "created_utc": comment.created_utc,
+            "permalink": f"https://reddit.com{comment.permalink}"
+        })
+        if level + 1 < depth:
+            stack.extend((reply, level + 1) for reply in comment.replies)
+    comments.sort(key=lambda comment: comment["score"], reverse=True)
+    return comments[:count]
+
+# Shared two-tier response cache (memory LRU + SQLite)
+response_cache = ResponseCache()
+
+def _posts_cache_key(
+    title_keyword: str, sort: str, limit: int, comment_limit: int, comment_depth: int, comment_sort: str,
+    tool: str = "fetch_posts_by_title"
+) -> str:
+    """
+    Cache key of one keyword's posts. Batched results live under their own `tool`
+    namespace: they come from a shared OR search, so they are not interchangeable
+    with Reddit's own top posts for the keyword.
+    """
+    return make_key(tool, {
+        "title_keyword": title_keyword, "sort": sort, "limit": limit,
+        "comment_limit": comment_limit, "comment_depth": comment_depth, "comment_sort": comment_sort
+    })
 
 # Create MCP server
 logger.info("Creating Reddit MCP server")
 mcp = FastMCP("reddit-server")
 
+# Per-tool latency, upstream timing and error counters
+metrics = Metrics("reddit")
+metrics.register("cache", response_cache.stats)
+metrics.register("rate_limit", rate_limiter.stats)
+metrics.install_http_endpoint(mcp)
+
 @mcp.tool()
-async def fetch_posts_by_title(title_keyword: str, sort: str = "hot", limit: int = 3) -> str:
+@metrics.tool("fetch_posts_by_title")
+async def fetch_posts_by_title(
+    title_keyword: str,
+    sort: str = "hot",
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    incremental: bool = False,
+    comment_limit: int = 3,
+    comment_depth: int = 1,
+    comment_sort: str = "top"
+) -> str:
     """
     Fetch posts and their top comments from Reddit based on a title keyword search.
 
@@ -45,39 +221,48 @@ async def fetch_posts_by_title(title_keyword: str, sort: str = "hot", limit: int
         title_keyword: Keyword to search in post titles
         sort: Sort order (hot, new, top)
         limit: Number of posts to fetch (max 10)
+        refresh: Skip the response cache and fetch fresh results
+        output_format: json (indented), compact or msgpack (base64)
+        fields: Post fields to return, dotted for nested ones (e.g. ["title", "comments.body"])
+        max_text_length: Truncate titles, selftext and comment bodies to this many characters
+        incremental: Mark posts returned on earlier runs and only fetch comments for new ones (stops early with sort="new")
+        comment_limit: Number of comments to return per post, highest scored first (0 to skip comments)
+        comment_depth: Reply levels to include; 1 returns top-level comments only
+        comment_sort: Order Reddit selects comments in (top, confidence, new, controversial, old, qa)
     """
-    logger.info(f"Fetching Reddit posts for keyword: {title_keyword}, sort: {sort}, limit: {limit}")
+    logger.info("Fetching Reddit posts for keyword: %s, sort: %s, limit: %s", title_keyword, sort, limit)
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    if comment_sort not in COMMENT_SORTS:
+        return json.dumps({"error": f"Invalid comment_sort: {comment_sort}. Use one of {', '.join(COMMENT_SORTS)}"}, indent=2)
+    cache_key = _posts_cache_key(title_keyword, sort, limit, comment_limit, comment_depth, comment_sort)
+    # Incremental results depend on the stored watermark, so they never come from the cache
+    if not refresh and not incremental:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached Reddit posts for keyword: %s", title_keyword)
+            with metrics.phase("serialize"):
+                return render(json.loads(cached), "posts", output_format, fields, max_text_length)
     try:
-        posts = []
-        for submission in reddit.subreddit("all").search(f"{title_keyword}", sort=sort, limit=min(limit, 5)):
-            logger.debug(f"Processing Reddit post: {submission.id}")
-            post_data = {
-                "id": submission.id,
-                "title": submission.title,
-                "subreddit": submission.subreddit.display_name,
-                "author": str(submission.author) if submission.author else "[deleted]",
-                "score": submission.score,
-                "num_comments": submission.num_comments,
-                "created_utc": submission.created_utc,
-                "url": submission.url,
-                "selftext": submission.selftext,
-                "permalink": f"https://reddit.com{submission.permalink}"
-            }
-            # Fetch top 3 comments
-            submission.comments.replace_more(limit=0)
-            comments = [
-                {
-                    "id": comment.id,
-                    "author": str(comment.author) if comment.author else "[deleted]",
-                    "body": comment.body,
-                    "score": comment.score,
-                    "created_utc": comment.created_utc,
-                    "permalink": f"https://reddit.com{comment.permalink}"
-                }
-                for comment in submission.comments.list()[:3]
-            ]
+        watermark = watermarks.get("reddit", title_keyword) if incremental else None
+        since = watermark["last_created"] if watermark else None
+        posts = await run_blocking(_search_posts, title_keyword, sort, min(limit, 5), since)
+        if incremental:
+            # Listings other than "new" mix old and new posts, so "seen" means returned before
+            seen = watermarks.seen("reddit", title_keyword, [post["id"] for post in posts])
+            for post_data in posts:
+                post_data["is_new"] = post_data["id"] not in seen
+        # Fetch the top comments for every post concurrently, skipping posts already seen on a previous run
+        fresh = [post for post in posts if post.get("is_new", True)]
+        comment_lists = await asyncio.gather(*(
+            run_blocking(_fetch_comments, post["id"], comment_limit, comment_depth, comment_sort)
+            for post in (fresh if comment_limit > 0 else [])
+        ))
+        for post_data, comments in zip(fresh, comment_lists):
             post_data["comments"] = comments
-            posts.append(post_data)
+        for post_data in posts:
+            post_data.setdefault("comments", [])
 
         result = {
             "keyword": title_keyword,
@@ -85,17 +270,153 @@ async def fetch_posts_by_title(title_keyword: str, sort: str = "hot", limit: int
             "posts": posts,
             "count": len(posts)
         }
-        logger.info(f"Successfully fetched {len(posts)} Reddit posts for keyword: {title_keyword}")
-        return json.dumps(result, indent=2)
+        if incremental:
+            result["since"] = since
+            result["new_count"] = len(fresh)
+            if fresh:
+                watermarks.mark_seen("reddit", title_keyword, [post["id"] for post in fresh])
+                newest = max(fresh, key=lambda post: post["created_utc"])
+                watermarks.advance("reddit", title_keyword, newest["id"], newest["created_utc"])
+        warehouse.ingest("reddit", title_keyword, result)
+        logger.info("Successfully fetched %s Reddit posts for keyword: %s", len(posts), title_keyword)
+        with metrics.phase("serialize"):
+            if not incremental:
+                response_cache.put("fetch_posts_by_title", cache_key, encode(result, "compact"))
+            return render(result, "posts", output_format, fields, max_text_length)
     except Exception as e:
-        logger.error(f"Failed to fetch Reddit posts: {e}", exc_info=True)
+        logger.error("Failed to fetch Reddit posts: %s", e, exc_info=True)
         return json.dumps({"error": f"Failed to fetch posts: {str(e)}"}, indent=2)
 
+@mcp.tool()
+@metrics.tool("fetch_posts_by_titles")
+async def fetch_posts_by_titles(
+    title_keywords: List[str],
+    sort: str = "hot",
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    comment_limit: int = 3,
+    comment_depth: int = 1,
+    comment_sort: str = "top"
+) -> str:
+    """
+    Fetch posts and their top comments for many keywords with as few searches as possible.
+
+    Keywords are packed into OR queries up to Reddit's query length limit, and the
+    returned posts are assigned to every keyword they match. A keyword left with
+    fewer than `limit` posts (crowded out by more popular ones in its batch) gets a
+    search of its own. Results are cached per keyword; fresh fetch_posts_by_title
+    results for a keyword are served from its cache as well.
+
+    Args:
+        title_keywords: Keywords to search in post titles
+        sort: Sort order (hot, new, top)
+        limit: Number of posts per keyword (max 5)
+        refresh: Skip the response cache and fetch fresh results
+        output_format: json (indented), compact or msgpack (base64)
+        fields: Post fields to return, dotted for nested ones (e.g. ["title", "comments.body"])
+        max_text_length: Truncate titles, selftext and comment bodies to this many characters
+        comment_limit: Number of comments to return per post, highest scored first (0 to skip comments)
+        comment_depth: Reply levels to include; 1 returns top-level comments only
+        comment_sort: Order Reddit selects comments in (top, confidence, new, controversial, old, qa)
+    """
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    if comment_sort not in COMMENT_SORTS:
+        return json.dumps({"error": f"Invalid comment_sort: {comment_sort}. Use one of {', '.join(COMMENT_SORTS)}"}, indent=2)
+    per_keyword = min(max(1, limit), 5)
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in title_keywords if keyword.strip()))
+    logger.info("Fetching Reddit posts for %s keywords, sort: %s, limit: %s", len(keywords), sort, per_keyword)
+    results = {}
+    missing = []
+    for keyword in keywords:
+        cached = None
+        if not refresh:
+            cached = response_cache.get(_posts_cache_key(keyword, sort, limit, comment_limit, comment_depth, comment_sort))
+            if cached is None:
+                cached = response_cache.get(_posts_cache_key(
+                    keyword, sort, limit, comment_limit, comment_depth, comment_sort, tool="fetch_posts_by_titles"
+                ))
+        if cached is not None:
+            results[keyword] = json.loads(cached)
+        else:
+            missing.append(keyword)
+    try:
+        batches = pack_keywords(missing, REDDIT_QUERY_MAX_LENGTH)
+        searches = await asyncio.gather(*(
+            run_blocking(_search_posts, or_query(batch), sort, min(REDDIT_SEARCH_MAX_LIMIT, len(batch) * per_keyword * 2))
+            for batch in batches
+        ))
+        assigned = {}
+        for batch, posts in zip(batches, searches):
+            assigned.update(demultiplex(
+                posts, batch, lambda post: f"{post['title']} {post['selftext']}", per_keyword
+            ))
+        # Backfill keywords the shared searches left short with a search of their own
+        short = [keyword for keyword in missing if len(assigned.get(keyword, [])) < per_keyword]
+        backfills = await asyncio.gather(*(run_blocking(_search_posts, keyword, sort, per_keyword) for keyword in short))
+        assigned.update(zip(short, backfills))
+
+        # Every post needs its comments once, however many keywords it matched
+        unique = {post["id"]: post for posts in assigned.values() for post in posts}
+        comment_lists = await asyncio.gather(*(
+            run_blocking(_fetch_comments, post_id, comment_limit, comment_depth, comment_sort)
+            for post_id in (unique if comment_limit > 0 else [])
+        ))
+        comments_by_id = dict(zip(unique if comment_limit > 0 else [], comment_lists))
+        for keyword, posts in assigned.items():
+            posts = [{**post, "comments": comments_by_id.get(post["id"], [])} for post in posts]
+            results[keyword] = {"keyword": keyword, "sort": sort, "posts": posts, "count": len(posts)}
+            warehouse.ingest("reddit", keyword, results[keyword])
+            response_cache.put(
+                "fetch_posts_by_titles",
+                _posts_cache_key(keyword, sort, limit, comment_limit, comment_depth, comment_sort, tool="fetch_posts_by_titles"),
+                encode(results[keyword], "compact")
+            )
+        logger.info(
+            "Fetched Reddit posts for %s keywords with %s searches, %s backfilled (%s from cache)",
+            len(keywords), len(batches) + len(short), len(short), len(keywords) - len(missing)
+        )
+        with metrics.phase("serialize"):
+            return encode({
+                "results": [
+                    {**results[keyword], "posts": truncate_text(project(results[keyword]["posts"], fields), max_text_length)}
+                    for keyword in keywords
+                ],
+                "count": len(keywords),
+                "searches": len(batches) + len(short),
+            }, output_format)
+    except Exception as e:
+        logger.error("Failed to fetch batched Reddit posts: %s", e, exc_info=True)
+        return json.dumps({"error": f"Failed to fetch posts: {str(e)}"}, indent=2)
+
+@mcp.tool()
+async def rate_limit_stats() -> str:
+    """Return queue depth, wait times and the learned rate limit for the Reddit API."""
+    return json.dumps(rate_limiter.stats(), indent=2)
+
+@mcp.tool()
+async def get_metrics(format: str = "json") -> str:
+    """Return server metrics as a JSON summary or, with format="prometheus", Prometheus text."""
+    if format == "prometheus":
+        return metrics.render()
+    return json.dumps(metrics.snapshot(), indent=2)
+
+@mcp.tool()
+async def cache_stats() -> str:
+    """Return hit/miss counts and size of the response cache."""
+    return json.dumps(response_cache.stats(), indent=2)
+
 if __name__ == "__main__":
     logger.info("Starting reddit MCP server")
     try:
-        mcp.run()
+        run_server(mcp, "REDDIT", 8001)
         logger.info("reddit MCP server stopped")
     except Exception as e:
-        logger.error(f"Error running reddit MCP server: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        logger.error("Error running reddit MCP server: %s", e, exc_info=True)
+        raise
+    finally:
+        reddit_executor.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
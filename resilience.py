@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header carrying how many milliseconds the caller will wait for a response
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+
+def request_deadline() -> Optional[float]:
+    """
+    Seconds the caller of the current MCP request will wait, from its deadline
+    header, or None outside an HTTP request or when no deadline was sent.
+    """
+    try:
+        from fastmcp.server.dependencies import get_http_request
+        request = get_http_request()
+    except (ImportError, RuntimeError):
+        return None
+    value = request.headers.get(DEADLINE_HEADER)
+    try:
+        return max(0.0, int(value) / 1000) if value is not None else None
+    except ValueError:
+        logger.warning("Ignoring invalid %s header: %r", DEADLINE_HEADER, value)
+        return None
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} backend is unavailable (circuit open), retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a backend is unhealthy.
+
+    After enough consecutive failures the circuit opens and calls are rejected
+    without touching the backend. Once the reset period has passed it half-opens
+    and lets a limited number of probe calls through: a successful probe closes
+    it again, a failed one reopens it. Settings come from the environment:
+
+        <NAME>_BREAKER_FAILURES     consecutive failures that open the circuit (default 5)
+        <NAME>_BREAKER_RESET        seconds to stay open before probing (default 30)
+        <NAME>_BREAKER_PROBES       concurrent probe calls while half-open (default 1)
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        prefix = name.upper()
+        self.failure_threshold = int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5"))
+        self.reset_timeout = float(os.getenv(f"{prefix}_BREAKER_RESET", "30"))
+        self.max_probes = int(os.getenv(f"{prefix}_BREAKER_PROBES", "1"))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def before(self) -> None:
+        """Admit a call or raise CircuitOpenError."""
+        if self.state == self.OPEN:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, retry_in)
+            logger.info("Circuit for %s half-open, probing the backend", self.name)
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.max_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self.probes += 1
+
+    def success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit for %s closed, backend recovered", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit for %s opened after %s consecutive failures", self.name, self.failures)
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probes = 0
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], is_failure: Callable[[BaseException], bool]) -> Any:
+        """Run `fn` under the breaker; exceptions for which `is_failure` is true count against the backend."""
+        self.before()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Abandoned by the caller; says nothing about the backend, but frees a probe slot
+            if self.state == self.HALF_OPEN:
+                self.probes = max(0, self.probes - 1)
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self.failure()
+            else:
+                self.success()
+            raise
+        self.success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "open": self.state == self.OPEN,
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Hedger:
+    """
+    Hedged requests: when an attempt is slower than a recent latency percentile,
+    a second identical attempt is started and whichever succeeds first wins.
+
+    Latencies are tracked per backend over a sliding window; no hedging happens
+    until enough samples exist. Settings come from the environment:
+
+        <PREFIX>_HEDGE_ENABLED       turn hedging on (default off)
+        <PREFIX>_HEDGE_PERCENTILE    latency percentile that triggers a hedge (default 0.95)
+        <PREFIX>_HEDGE_MIN_SAMPLES   samples needed before hedging (default 20)
+        <PREFIX>_HEDGE_MIN_DELAY     never hedge sooner than this many seconds (default 0.05)
+    """
+
+    def __init__(self, prefix: str = "PROXY", window: int = 200):
+        self.enabled = os.getenv(f"{prefix}_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.percentile = float(os.getenv(f"{prefix}_HEDGE_PERCENTILE", "0.95"))
+        self.min_samples = int(os.getenv(f"{prefix}_HEDGE_MIN_SAMPLES", "20"))
+        self.min_delay = float(os.getenv(f"{prefix}_HEDGE_MIN_DELAY", "0.05"))
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, backend: str, name: str) -> None:
+        counts = self._counts.setdefault(backend, {"requests": 0, "hedged": 0, "hedge_wins": 0})
+        counts[name] += 1
+
+    def delay_for(self, backend: str) -> Optional[float]:
+        """Seconds to wait before hedging a request to `backend`, or None to not hedge."""
+        samples = self._latencies.get(backend)
+        if not self.enabled or samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    async def _timed(self, backend: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        result = await fn()
+        self._latencies.setdefault(backend, deque(maxlen=self.window)).append(time.monotonic() - started)
+        return result
+
+    async def run(self, backend: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._count(backend, "requests")
+        delay = self.delay_for(backend)
+        if delay is None:
+            return await self._timed(backend, fn)
+
+        first = asyncio.ensure_future(self._timed(backend, fn))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            logger.debug("Hedging request to %s after %.3fs", backend, delay)
+            self._count(backend, "hedged")
+            second = asyncio.ensure_future(self._timed(backend, fn))
+            tasks.add(second)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count(backend, "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backends": {
+                backend: {**counts, "hedge_delay": self.delay_for(backend)}
+                for backend, counts in self._counts.items()
+            },
+        }
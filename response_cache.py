@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default time-to-live in seconds for each cached tool, overridable with CACHE_TTL_<TOOL>
+DEFAULT_TTLS = {
+    "fetch_posts_by_title": 900,
+    "fetch_posts_by_titles": 900,
+    "fetch_tweets_by_keyword": 300,
+    "fetch_tweets_by_keywords": 300,
+    "search": 3600,
+}
+
+# Bumped when the format of cached values changes, so entries in an older format are never read
+CACHE_KEY_VERSION = 2
+
+# Arguments that never take part in the cache key
+IGNORED_ARGS = {"api_key", "refresh"}
+
+
+def normalize_args(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize tool arguments so equivalent calls share a cache entry."""
+    normalized = {}
+    for name, value in args.items():
+        if name in IGNORED_ARGS or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip().lower()
+        elif isinstance(value, dict):
+            value = normalize_args(value)
+        normalized[name] = value
+    return normalized
+
+
+def make_key(tool: str, args: Dict[str, Any]) -> str:
+    """Stable cache key for a tool call: the tool name plus a hash of its normalized arguments."""
+    payload = json.dumps(normalize_args(args), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{tool}:v{CACHE_KEY_VERSION}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class ResponseCache:
+    """
+    Two-tier TTL cache for tool responses.
+
+    A bounded in-memory LRU sits in front of a persistent SQLite store, so hot
+    keywords are answered from memory and everything else survives restarts.
+    Configuration comes from the environment:
+
+        RESPONSE_CACHE_DISABLED      skip the cache entirely (default off)
+        RESPONSE_CACHE_PATH          SQLite file (default cache/responses.sqlite3)
+        RESPONSE_CACHE_MEMORY_ITEMS  entries kept in the memory LRU (default 256)
+        RESPONSE_CACHE_MAX_BYTES     total size of the SQLite store (default 50 MB)
+        CACHE_TTL_<TOOL>             TTL in seconds for one tool, e.g. CACHE_TTL_SEARCH
+
+    Other caches built on this class pass their own `prefix` and default TTLs.
+    """
+
+    def __init__(self, path: Optional[str] = None, prefix: str = "RESPONSE_CACHE",
+                 ttls: Optional[Dict[str, float]] = None, default_path: str = os.path.join("cache", "responses.sqlite3")):
+        self.enabled = os.getenv(f"{prefix}_DISABLED", "false").lower() not in ("1", "true", "yes")
+        self.path = path or os.getenv(f"{prefix}_PATH", default_path)
+        self.memory_items = int(os.getenv(f"{prefix}_MEMORY_ITEMS", "256"))
+        self.max_bytes = int(os.getenv(f"{prefix}_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.ttls = {
+            tool: float(os.getenv(f"CACHE_TTL_{tool.upper()}", str(default)))
+            for tool, default in (DEFAULT_TTLS if ttls is None else ttls).items()
+        }
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.enabled:
+            self._open()
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " tool TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        logger.info("Opened response cache at %s", self.path)
+
+    def ttl_for(self, tool: str) -> float:
+        return self.ttls.get(tool, float(os.getenv(f"CACHE_TTL_{tool.upper()}", "600")))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for `key`, or None when missing or expired."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._remember(key, row[0], row[1])
+                self.hits["disk"] += 1
+                return row[0]
+            if row is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, tool: str, key: str, value: str) -> None:
+        """Store `value` under `key` with the TTL configured for `tool`."""
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_for(tool)
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, tool, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, value, size, expires_at, now)
+            )
+            self._evict(now)
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired rows, then least recently used rows until the store fits in max_bytes."""
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+        with self._lock:
+            disk_entries = 0
+            disk_bytes = 0
+            if self._db is not None:
+                disk_entries, disk_bytes = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            return {
+                "enabled": self.enabled,
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+            }
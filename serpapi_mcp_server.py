@@ -1,77 +1,294 @@
-from mcp.server.fastmcp import FastMCP
+from fastmcp import FastMCP
 from dotenv import load_dotenv
 import os
-from typing import Dict, Any
-from serpapi import SerpApiClient as SerpApiSearch
+from typing import Dict, Any, List, Optional
 import httpx
-import logging
+import json
+import asyncio
+from log_setup import log_payload, setup_logging
+from server_transport import run_server
+from response_cache import ResponseCache, make_key
+from output_format import OUTPUT_FORMATS, encode, format_error, project, render, truncate_text
+from metrics import Metrics
+from rate_limit import RateLimiter, RetryableError, retry_after_from
+from http_pool import get_pool
+from dedup import canonicalize_url
+from warehouse import Warehouse
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/serpapi_mcp_server.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = setup_logging("serpapi_mcp_server")
 
 # Load environment variables from .env file
 load_dotenv()
 logger.debug("Loading SerpApi environment variables")
 API_KEY = os.getenv("SERPAPI_API_KEY")
 
+# Alternative API host, e.g. a local stand-in used by the benchmark harness
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com").rstrip("/")
+SERPAPI_SEARCH_URL = f"{SERPAPI_BASE_URL}/search"
+
+# Results per page when `limit` spans several pages; Google accepts up to 100
+SERPAPI_PAGE_SIZE = int(os.getenv("SERPAPI_PAGE_SIZE", "10"))
+# Engines paginated with start/num; others return a single page
+PAGINATED_ENGINE_PREFIX = "google"
+
 # Ensure API key is present
 if not API_KEY:
     logger.error("SERPAPI_API_KEY not found in environment variables")
     raise ValueError("SERPAPI_API_KEY not found in environment variables. Please set it in the .env file.")
 
+# Shared two-tier response cache (memory LRU + SQLite)
+response_cache = ResponseCache()
+
+# Local history of every fetched search result
+warehouse = Warehouse()
+
+# Throughput allowed by the SerpApi plan; tune with SERPAPI_RATE_LIMIT_PER_SEC
+rate_limiter = RateLimiter("serpapi", rate=5, burst=10)
+
+# Keep-alive connections to SerpApi shared by all tool calls
+http_pool = get_pool("SERPAPI_HTTP", backends={"serpapi": 30})
+
 # Initialize the MCP server
 logger.info("Creating SerpApi MCP server")
-mcp = FastMCP("SerpApi MCP Server")
+mcp = FastMCP("SerpApi MCP Server", lifespan=http_pool.lifespan)
+
+# Per-tool latency, upstream timing and error counters
+metrics = Metrics("serpapi")
+metrics.register("cache", response_cache.stats)
+metrics.register("rate_limit", rate_limiter.stats)
+metrics.install_http_endpoint(mcp)
+
+async def _request_search(params: Dict[str, Any]) -> Dict[str, Any]:
+    with metrics.upstream("serpapi"):
+        response = await http_pool.client.get(
+            SERPAPI_SEARCH_URL, params={"output": "json", "source": "python", **params},
+            timeout=http_pool.timeout_for("serpapi")
+        )
+    metrics.upstream_status("serpapi", response.status_code)
+    rate_limiter.observe_headers(response.headers)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(
+            f"SerpApi returned {response.status_code}",
+            status=response.status_code,
+            retry_after=retry_after_from(response.headers)
+        )
+    # SerpApi reports bad parameters as a 400 with an "error" body; let the caller show it
+    if response.status_code != 400:
+        response.raise_for_status()
+    return response.json()
+
+async def search_pages(params: Dict[str, Any], limit: Optional[int]) -> Dict[str, Any]:
+    """
+    Fetch enough result pages for `limit` organic results concurrently and merge them.
+
+    Without a limit, or for engines that do not paginate with start/num, one request is made.
+    Pages that fail after retries are listed under "errors" next to the results of the
+    pages that succeeded; only when every page fails is the first failure raised.
+    """
+    if not limit or not params["engine"].startswith(PAGINATED_ENGINE_PREFIX):
+        data = await rate_limiter.call(_request_search, params)
+        if limit and "organic_results" in data:
+            data["organic_results"] = data["organic_results"][:limit]
+        return data
+    page_size = min(limit, SERPAPI_PAGE_SIZE)
+    start = int(params.get("start", 0))
+    offsets = range(0, limit, page_size)
+    pages = await asyncio.gather(*(
+        rate_limiter.call(_request_search, {**params, "start": start + offset, "num": page_size})
+        for offset in offsets
+    ), return_exceptions=True)
+    failed = [(offset, page) for offset, page in zip(offsets, pages) if isinstance(page, Exception)]
+    if len(failed) == len(pages):
+        raise failed[0][1]
+    pages = [page for page in pages if not isinstance(page, Exception)]
+    if "error" in pages[0] and not failed:
+        return pages[0]
+    merged = {"organic_results": []}
+    if failed:
+        logger.warning("%s of %s SerpApi result pages failed", len(failed), len(offsets))
+        merged["errors"] = [{"start": start + offset, "error": str(error)} for offset, error in failed]
+    seen = set()
+    for page in pages:
+        # A later page past the last result may come back empty or as an error
+        for result in page.get("organic_results", []):
+            link = canonicalize_url(result.get("link")) or result.get("link")
+            if link in seen:
+                continue
+            seen.add(link)
+            merged["organic_results"].append(result)
+    merged["organic_results"] = merged["organic_results"][:limit]
+    for position, result in enumerate(merged["organic_results"], start=start + 1):
+        result["position"] = position
+    return merged
+
+def organic_results(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "position": result.get("position"),
+            "title": result.get("title", "No title"),
+            "link": result.get("link", "No link"),
+            "snippet": result.get("snippet", "No snippet")
+        }
+        for result in data.get("organic_results", [])
+    ]
+
+async def search_many(
+    params: Dict[str, Any],
+    limit: Optional[int],
+    engines: List[str],
+    queries: List[Optional[str]]
+) -> Dict[str, Any]:
+    """
+    Run every engine/query combination in parallel and merge their results.
+
+    Results are interleaved by rank, so every combination is represented near the
+    top, and a page linked from several combinations is kept once. Failed
+    combinations are reported under "errors" instead of failing the whole call.
+    """
+    combos = [(engine, query) for engine in engines for query in queries]
+    responses = await asyncio.gather(*(
+        search_pages({**params, "engine": engine, **({"q": query} if query is not None else {})}, limit)
+        for engine, query in combos
+    ), return_exceptions=True)
+    ranked, errors = [], []
+    for (engine, query), data in zip(combos, responses):
+        if isinstance(data, Exception) or "error" in data:
+            error = str(data) if isinstance(data, Exception) else data["error"]
+            logger.warning("SerpApi search for engine %s, query %s failed: %s", engine, query, error)
+            errors.append({"engine": engine, "query": query, "error": error})
+            continue
+        errors.extend({"engine": engine, "query": query, **error} for error in data.get("errors", []))
+        ranked.append([{**result, "engine": engine, "query": query} for result in organic_results(data)])
+
+    results = []
+    seen = set()
+    for rank in range(max((len(results_for) for results_for in ranked), default=0)):
+        for results_for in ranked:
+            if rank >= len(results_for):
+                continue
+            result = results_for[rank]
+            link = canonicalize_url(result["link"]) or result["link"]
+            if link in seen:
+                continue
+            seen.add(link)
+            results.append(result)
+    return {
+        "engine": engines if len(engines) > 1 else engines[0],
+        "query": queries if len(queries) > 1 else queries[0],
+        "results": results,
+        "count": len(results),
+        "errors": errors,
+    }
+
+def format_text(results: List[Dict[str, Any]]) -> str:
+    """Free-form text rendering of organic results, the tool's original output."""
+    formatted_results = []
+    for result in results:
+        title = result.get("title", "No title")
+        link = result.get("link", "No link")
+        snippet = result.get("snippet", "No snippet")
+        formatted_results.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n")
+    return "\n".join(formatted_results) if formatted_results else "No organic results found"
+
+def render_results(
+    structured: Dict[str, Any],
+    output_format: str,
+    fields: Optional[List[str]],
+    max_text_length: Optional[int]
+) -> str:
+    if output_format == "text":
+        return format_text(truncate_text(project(structured["results"], fields), max_text_length))
+    return render(structured, "results", output_format, fields, max_text_length)
 
 # Tool to perform searches via SerpApi
 @mcp.tool()
-async def search(params: Dict[str, Any] = {}) -> str:
+@metrics.tool("search")
+async def search(
+    params: Dict[str, Any] = {},
+    limit: Optional[int] = None,
+    engines: Optional[List[str]] = None,
+    queries: Optional[List[str]] = None,
+    refresh: bool = False,
+    output_format: str = "text",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None
+) -> str:
     """Perform a search on the specified engine using SerpApi.
 
     Args:
         params: Dictionary of engine-specific parameters (e.g., {"q": "Coffee", "engine": "google_light", "location": "Austin, TX"}).
+        limit: Number of organic results per engine and query; several pages are fetched concurrently when needed.
+        engines: Run the search on each of these engines in parallel and merge the results.
+        queries: Run each of these queries in parallel (instead of params["q"]) and merge the results.
+        refresh: Skip the response cache and fetch fresh results.
+        output_format: text (formatted results), json, compact or msgpack (base64) structured results.
+        fields: Result fields to return (e.g. ["title", "link"]).
+        max_text_length: Truncate titles and snippets to this many characters.
 
     Returns:
         A formatted string of search results or an error message.
     """
-    logger.info(f"Performing SerpAPI search with params: {params}")
+    logger.info("Performing SerpAPI search with params: %s, limit: %s, engines: %s, queries: %s",
+                params, limit, engines, queries)
+    format_problem = format_error(output_format, ("text",) + OUTPUT_FORMATS)
+    if format_problem:
+        return f"Error: {format_problem}"
     params = {
         "api_key": API_KEY,
         "engine": "google_light",  # Fastest engine by default
         **params  # Include any additional parameters
     }
+    cache_key = make_key("search", {**params, "limit": limit, "engines": engines, "queries": queries})
+    if not refresh:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached SerpAPI search results")
+            with metrics.phase("serialize"):
+                return render_results(json.loads(cached), output_format, fields, max_text_length)
 
     try:
-        search = SerpApiSearch(params)
         logger.debug("Executing SerpApi search")
-        data = search.get_dict()
-        logger.debug(f"Search results: {data}")
-
-        # Process organic search results if available
-        if "organic_results" in data:
-            formatted_results = []
-            for result in data.get("organic_results", []):
-                title = result.get("title", "No title")
-                link = result.get("link", "No link")
-                snippet = result.get("snippet", "No snippet")
-                formatted_results.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n")
-            logger.info(f"Successfully fetched {len(formatted_results)} SerpApi results")
-            return "\n".join(formatted_results) if formatted_results else "No organic results found"
+        if engines or queries:
+            structured = await search_many(params, limit, engines or [params["engine"]], queries or [params.get("q")])
+            if not structured["results"] and structured["errors"]:
+                return f"Error: {structured['errors'][0]['error']}"
         else:
-            logger.warning("No organic results found")
-            return "No organic results found"
+            data = await search_pages(params, limit)
+            log_payload(logger, data, "Search results")
+            if "error" in data:
+                logger.error("SerpApi returned an error: %s", data['error'])
+                return f"Error: {data['error']}"
+
+            # Process organic search results if available
+            if "organic_results" not in data:
+                logger.warning("No organic results found")
+                return "No organic results found"
+            structured = {
+                "engine": params["engine"],
+                "query": params.get("q"),
+                "results": organic_results(data)
+            }
+            structured["count"] = len(structured["results"])
+            if data.get("errors"):
+                structured["errors"] = data["errors"]
+        logger.info("Successfully fetched %s SerpApi results", structured['count'])
+        warehouse.ingest("serpapi", params.get("q"), structured)
+        with metrics.phase("serialize"):
+            # Partial results from a multi-search are not cached, so the failed part is retried next time
+            if not structured.get("errors"):
+                response_cache.put("search", cache_key, encode(structured, "compact"))
+            return render_results(structured, output_format, fields, max_text_length)
 
+    # Rate limited or failing upstream, still failing after the retries
+    except RetryableError as e:
+        logger.error("SerpAPI search failed after retries: %s", e, exc_info=True)
+        if e.status == 429:
+            return "Error: Rate limit exceeded. Please try again later."
+        return f"Error: {e.status} - {e}"
     # Handle HTTP-specific errors
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error during SerpAPI search: {e}", exc_info=True)
+        logger.error("HTTP error during SerpAPI search: %s", e, exc_info=True)
         if e.response.status_code == 429:
             return "Error: Rate limit exceeded. Please try again later."
         elif e.response.status_code == 401:
@@ -80,15 +297,32 @@ async def search(params: Dict[str, Any] = {}) -> str:
             return f"Error: {e.response.status_code} - {e.response.text}"
     # Handle other exceptions (e.g., network issues)
     except Exception as e:
-        logger.error(f"Error during SerpAPI search: {e}", exc_info=True)
+        logger.error("Error during SerpAPI search: %s", e, exc_info=True)
         return f"Error: {str(e)}"
 
+@mcp.tool()
+async def rate_limit_stats() -> str:
+    """Return queue depth, wait times and the learned rate limit for SerpApi."""
+    return json.dumps(rate_limiter.stats(), indent=2)
+
+@mcp.tool()
+async def get_metrics(format: str = "json") -> str:
+    """Return server metrics as a JSON summary or, with format="prometheus", Prometheus text."""
+    if format == "prometheus":
+        return metrics.render()
+    return json.dumps(metrics.snapshot(), indent=2)
+
+@mcp.tool()
+async def cache_stats() -> str:
+    """Return hit/miss counts and size of the response cache."""
+    return json.dumps(response_cache.stats(), indent=2)
+
 # Run the server
 if __name__ == "__main__":
     logger.info("Starting serpapi MCP server")
     try:
-        mcp.run()
+        run_server(mcp, "SERPAPI", 8003)
         logger.info("serpapi MCP server stopped")
     except Exception as e:
-        logger.error(f"Error running serpapi MCP server: {e}", exc_info=True)
+        logger.error("Error running serpapi MCP server: %s", e, exc_info=True)
         raise
\ No newline at end of file
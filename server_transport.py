@@ -0,0 +1,65 @@
+import os
+import inspect
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Transports that serve MCP over the network instead of stdin/stdout
+NETWORK_TRANSPORTS = ("sse", "streamable-http")
+# URL path each network transport is served on
+TRANSPORT_PATHS = {"sse": "/sse", "streamable-http": "/mcp"}
+
+
+def transport_settings(name: str, default_port: int) -> dict:
+    """
+    Read the transport settings for one server from the environment:
+
+        <NAME>_MCP_TRANSPORT   stdio (default), sse or streamable-http ("http" is an alias)
+        <NAME>_MCP_HOST        interface to bind / connect to (default 127.0.0.1)
+        <NAME>_MCP_PORT        port to bind / connect to
+        <NAME>_MCP_URL         full URL clients connect to, overriding host/port
+    """
+    transport = os.getenv(f"{name}_MCP_TRANSPORT", "stdio").lower()
+    if transport == "http":
+        transport = "streamable-http"
+    host = os.getenv(f"{name}_MCP_HOST", "127.0.0.1")
+    port = int(os.getenv(f"{name}_MCP_PORT", str(default_port)))
+    url = os.getenv(f"{name}_MCP_URL") or f"http://{host}:{port}{TRANSPORT_PATHS.get(transport, '')}"
+    return {"transport": transport, "host": host, "port": port, "url": url}
+
+
+def run_server(mcp, name: str, default_port: int) -> None:
+    """Run a FastMCP server on the transport configured for `name`."""
+    settings = transport_settings(name, default_port)
+    transport = settings["transport"]
+    if transport not in NETWORK_TRANSPORTS:
+        mcp.run()
+        return
+
+    logger.info(f"Serving {name} MCP server over {transport} at {settings['url']}")
+    parameters = inspect.signature(mcp.run).parameters
+    if "host" in parameters or any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        # fastmcp takes host/port as run() arguments
+        mcp.run(transport=transport, host=settings["host"], port=settings["port"])
+    else:
+        # mcp.server.fastmcp reads them from the server settings instead
+        mcp.settings.host = settings["host"]
+        mcp.settings.port = settings["port"]
+        mcp.run(transport=transport)
+
+
+def client_params(name: str, default_port: int, stdio_params, headers: Optional[Dict[str, str]] = None):
+    """
+    Connection parameters for an MCPServerAdapter: the persistent server's URL, sending
+    `headers` with every request, when it runs on a network transport, otherwise the
+    given stdio parameters.
+    """
+    settings = transport_settings(name, default_port)
+    if settings["transport"] in NETWORK_TRANSPORTS:
+        logger.info(f"Connecting to running {name} MCP server at {settings['url']} over {settings['transport']}")
+        params = {"url": settings["url"], "transport": settings["transport"]}
+        if headers:
+            params["headers"] = headers
+        return params
+    return stdio_params
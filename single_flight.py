@@ -0,0 +1,43 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one upstream request.
+
+    The first caller for a key starts the request; callers that arrive while it
+    is still in flight await the same task and receive its result, or its
+    exception. The upstream request runs as its own task, so a caller that is
+    cancelled does not cancel the request for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.upstream = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.upstream += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.debug("Coalescing call onto in-flight request %s", key)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "upstream_requests": self.upstream,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,75 @@
+from dedup import SimHashIndex, canonicalize_url, collect_items, deduplicate, simhash
+
+
+def test_canonicalize_url_strips_tracking_and_normalizes():
+    url = "HTTP://www.Example.com/a//b/?utm_source=x&b=2&fbclid=y&a=1#frag"
+    assert canonicalize_url(url) == "https://example.com/a/b?a=1&b=2"
+
+
+def test_canonicalize_url_keeps_content_parameters():
+    assert canonicalize_url("https://example.com/search?s=foo") == "https://example.com/search?s=foo"
+    assert canonicalize_url("https://example.com/p?context=3") == "https://example.com/p?context=3"
+
+
+def test_canonicalize_url_strips_twitter_share_parameters():
+    assert canonicalize_url("https://x.com/a/status/1?s=20&t=abc") == "https://twitter.com/a/status/1"
+
+
+def test_canonicalize_url_collapses_reddit_and_youtube_links():
+    expected = "https://reddit.com/comments/abc123"
+    assert canonicalize_url("https://old.reddit.com/r/python/comments/ABC123/some_title/") == expected
+    assert canonicalize_url("https://redd.it/abc123") == expected
+    assert canonicalize_url("https://youtu.be/xyz?si=share") == "https://youtube.com/watch?v=xyz"
+
+
+def test_canonicalize_url_rejects_non_urls():
+    assert canonicalize_url(None) is None
+    assert canonicalize_url("") is None
+    assert canonicalize_url("not a url") is None
+
+
+def test_simhash_short_text_is_not_fingerprinted():
+    assert simhash("too short") is None
+
+
+def test_simhash_is_close_for_near_duplicates():
+    text = "the quick brown fox jumps over the lazy dog near the river bank today"
+    same = simhash(text)
+    assert same == simhash(text.upper())
+    other = simhash("completely unrelated sentence about databases and query planners running slowly")
+    assert bin(same ^ other).count("1") > 3
+
+
+def test_simhash_index_finds_values_within_distance():
+    index = SimHashIndex(distance=3)
+    index.add(0b1011, "a")
+    assert index.query(0b1011 ^ 0b111) == ["a"]
+    assert index.query(0b1011 ^ 0b1111) == []
+
+
+def test_deduplicate_clusters_by_url_and_text():
+    reddit = {"posts": [{
+        "id": "p1", "title": "New release", "selftext": "",
+        "permalink": "https://reddit.com/r/python/comments/p1/new_release/",
+        "url": "https://example.com/post?utm_source=reddit", "score": 10,
+    }]}
+    twitter = {"tweets": [{
+        "id": "1", "text": "Look at https://www.example.com/post/",
+        "author": {"username": "@someone"}, "metrics": {"like_count": 3},
+    }]}
+    serpapi = {"results": [
+        {"link": "https://blog.test/one", "title": "Shared words here", "snippet": "and a few more words in the snippet"},
+        {"link": "https://mirror.test/one", "title": "Shared words here", "snippet": "and a few more words in the snippet"},
+        {"link": "https://other.test/", "title": "Something else", "snippet": "entirely different text about gardening tips"},
+    ]}
+    items = collect_items(reddit, twitter, serpapi)
+    result = deduplicate(items)
+
+    assert result["input_count"] == 5
+    assert result["count"] == 3
+    assert result["duplicates"] == 2
+    sizes = [cluster["size"] for cluster in result["clusters"]]
+    assert sizes == [2, 2, 1]
+    assert result["clusters"][0]["sources"] == ["reddit", "twitter"]
+    assert result["clusters"][1]["sources"] == ["serpapi"]
+    assert "urls" not in result["clusters"][0]["representative"]
@@ -0,0 +1,50 @@
+import base64
+import json
+import sys
+import types
+
+import pytest
+
+from output_format import encode, format_error, project, render, truncate_text
+
+
+@pytest.fixture
+def without_msgpack(monkeypatch):
+    monkeypatch.setitem(sys.modules, "msgpack", None)
+
+
+@pytest.fixture
+def fake_msgpack(monkeypatch):
+    module = types.ModuleType("msgpack")
+    module.packb = lambda value, use_bin_type=True: json.dumps(value).encode("utf-8")
+    monkeypatch.setitem(sys.modules, "msgpack", module)
+
+
+def test_format_error_rejects_unknown_formats():
+    assert format_error("json") is None
+    assert "Unsupported output_format 'xml'" in format_error("xml")
+    assert format_error("text", ("text", "json")) is None
+
+
+def test_msgpack_is_rejected_when_not_installed(without_msgpack):
+    assert "not installed" in format_error("msgpack")
+    with pytest.raises(ValueError):
+        encode({"a": 1}, "msgpack")
+    with pytest.raises(ValueError):
+        render({"posts": []}, "posts", "msgpack")
+
+
+def test_msgpack_is_base64_encoded_when_installed(fake_msgpack):
+    assert format_error("msgpack") is None
+    assert base64.b64decode(encode({"a": 1}, "msgpack")) == b'{"a": 1}'
+
+
+def test_compact_encoding_has_no_whitespace():
+    assert encode({"a": [1, 2]}, "compact") == '{"a":[1,2]}'
+
+
+def test_project_and_truncate():
+    items = [{"title": "abcdef", "author": {"username": "x", "id": 1}, "score": 3}]
+    assert project(items, ["title", "author.username"]) == [{"title": "abcdef", "author": {"username": "x"}}]
+    assert truncate_text(items, 3)[0]["title"] == "abc..."
+    assert project(items, None) is items
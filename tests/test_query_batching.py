@@ -0,0 +1,57 @@
+from query_batching import demultiplex, keyword_clause, keyword_matcher, or_query, pack_keywords
+
+
+def test_keyword_clause_groups_multi_word_keywords():
+    assert keyword_clause("python") == "python"
+    assert keyword_clause(" ai agents ") == "(ai agents)"
+    assert keyword_clause('"ai agents"') == '"ai agents"'
+
+
+def test_or_query_joins_clauses():
+    assert or_query(["python", "ai agents"]) == "python OR (ai agents)"
+
+
+def test_pack_keywords_respects_max_length():
+    keywords = ["alpha", "beta", "gamma", "delta"]
+    batches = pack_keywords(keywords, max_length=len("gamma OR delta"))
+    assert batches == [["alpha", "beta"], ["gamma", "delta"]]
+    for batch in batches:
+        assert len(or_query(batch)) <= len("gamma OR delta")
+
+
+def test_pack_keywords_respects_max_terms():
+    assert pack_keywords(["a", "b", "c", "d", "e"], max_length=1000, max_terms=2) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_pack_keywords_gives_oversized_keyword_its_own_batch():
+    batches = pack_keywords(["short", "x" * 50, "tail"], max_length=10)
+    assert batches == [["short"], ["x" * 50], ["tail"]]
+
+
+def test_pack_keywords_keeps_order_and_everything():
+    keywords = [f"keyword{i}" for i in range(40)]
+    batches = pack_keywords(keywords, max_length=64)
+    assert [keyword for batch in batches for keyword in batch] == keywords
+
+
+def test_keyword_matcher_requires_every_word_in_any_order():
+    matches = keyword_matcher("ai agents")
+    assert matches("Agents built with AI")
+    assert not matches("AI models")
+    assert not matches(None)
+
+
+def test_keyword_matcher_quoted_phrase_needs_adjacent_words():
+    matches = keyword_matcher('"ai agents"')
+    assert matches("New AI-agents framework")
+    assert not matches("agents for ai")
+
+
+def test_demultiplex_assigns_items_to_every_matching_keyword_up_to_limit():
+    items = [{"text": "python and rust"}, {"text": "python only"}, {"text": "rust only"}, {"text": "go"}]
+    assigned = demultiplex(items, ["python", "rust", "java"], lambda item: item["text"], limit=1)
+    assert assigned == {
+        "python": [{"text": "python and rust"}],
+        "rust": [{"text": "python and rust"}],
+        "java": [],
+    }
@@ -0,0 +1,176 @@
+import json
+import asyncio
+import time
+
+import pytest
+
+from rate_limit import RateLimiter, ResponseHeaders, RetryableError, retry_after_from
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_BACKOFF_BASE", "0.001")
+    monkeypatch.setenv("RATE_LIMIT_BACKOFF_MAX", "0.01")
+
+
+def test_retry_after_from_prefers_retry_after():
+    assert retry_after_from({"retry-after": "7", "x-ratelimit-reset": "30"}) == 7.0
+
+
+def test_retry_after_from_converts_twitter_epoch_reset():
+    delay = retry_after_from({"x-rate-limit-reset": str(time.time() + 20)})
+    assert 19 <= delay <= 20
+    assert retry_after_from({"x-rate-limit-reset": str(time.time() - 5)}) == 0.0
+
+
+def test_retry_after_from_reads_reddit_seconds_and_ignores_garbage():
+    assert retry_after_from({"retry-after": "soon", "x-ratelimit-reset": "12"}) == 12.0
+    assert retry_after_from({}) is None
+
+
+def test_environment_overrides_defaults(monkeypatch):
+    monkeypatch.setenv("TESTAPI_RATE_LIMIT_PER_SEC", "2.5")
+    monkeypatch.setenv("TESTAPI_RATE_LIMIT_BURST", "4")
+    monkeypatch.setenv("TESTAPI_MAX_RETRIES", "1")
+    limiter = RateLimiter("testapi", rate=10, burst=20)
+    assert (limiter.rate, limiter.capacity, limiter.max_retries) == (2.5, 4.0, 1)
+
+
+def test_refill_is_capped_at_capacity():
+    limiter = RateLimiter("refill", rate=10, burst=5)
+    limiter.tokens = 0
+    limiter._refill(limiter.updated_at + 0.2)
+    assert limiter.tokens == pytest.approx(2)
+    limiter._refill(limiter.updated_at + 60)
+    assert limiter.tokens == 5
+
+
+def test_acquire_spends_burst_then_waits_for_refill():
+    limiter = RateLimiter("burst", rate=50, burst=2)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    assert elapsed >= 0.015
+    assert limiter.requests == 3
+    assert limiter.queue_depth == 0
+
+
+def test_observe_slows_rate_and_caps_tokens():
+    limiter = RateLimiter("observe", rate=10, burst=20)
+    limiter.observe(remaining=5, reset_in=10)
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter.tokens <= 5
+    limiter.observe(remaining=500, reset_in=10)
+    assert limiter.rate == 10
+    limiter.observe(remaining=5, reset_in=None)
+    assert limiter.rate == 10
+
+
+def test_observe_blocks_when_window_is_exhausted():
+    limiter = RateLimiter("exhausted", rate=10, burst=20)
+    limiter.observe(remaining=0, reset_in=30)
+    assert limiter.stats()["throttled_for"] > 29
+    assert limiter.tokens == 0
+
+
+def test_observe_headers_reads_reddit_headers():
+    limiter = RateLimiter("headers", rate=10, burst=20)
+    limiter.observe_headers({"x-ratelimit-remaining": "3", "x-ratelimit-reset": "6"})
+    assert limiter.remaining == 3
+    assert limiter.rate == pytest.approx(0.5)
+
+
+def test_backoff_is_bounded():
+    limiter = RateLimiter("backoff", rate=10, burst=20)
+    for attempt in range(10):
+        assert 0 <= limiter.backoff(attempt) <= limiter.backoff_max
+
+
+def test_call_retries_retryable_errors_then_succeeds():
+    limiter = RateLimiter("retry", rate=1000, burst=10)
+    attempts = []
+
+    async def flaky(value):
+        attempts.append(value)
+        if len(attempts) < 3:
+            raise RetryableError("server error", status=503)
+        return value * 2
+
+    assert asyncio.run(limiter.call(flaky, 21)) == 42
+    assert len(attempts) == 3
+    assert limiter.retries == 2
+
+
+def test_call_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setenv("GIVEUP_MAX_RETRIES", "1")
+    limiter = RateLimiter("giveup", rate=1000, burst=10)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise RetryableError("too many requests", status=429, retry_after=0.001)
+
+    with pytest.raises(RetryableError):
+        asyncio.run(limiter.call(failing))
+    assert len(calls) == 2
+
+
+def test_call_does_not_retry_other_errors():
+    limiter = RateLimiter("fatal", rate=1000, burst=10)
+
+    async def broken():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.call(broken))
+    assert limiter.retries == 0
+
+
+def reddit_adapter(headers):
+    requests = pytest.importorskip("requests")
+    adapters = pytest.importorskip("requests.adapters")
+
+    class FakeReddit(adapters.BaseAdapter):
+        """Answers PRAW's token and search requests the way Reddit does."""
+
+        def send(self, request, **kwargs):
+            response = requests.Response()
+            response.request, response.url, response.status_code = request, request.url, 200
+            response.headers["content-type"] = "application/json"
+            if "access_token" in request.url:
+                body = {"access_token": "token", "expires_in": 3600, "scope": "*", "token_type": "bearer"}
+            else:
+                response.headers.update(headers)
+                body = {"kind": "Listing", "data": {"children": [], "after": None}}
+            response._content = json.dumps(body).encode()
+            return response
+
+        def close(self):
+            pass
+
+    return FakeReddit()
+
+
+def test_reddit_rate_limit_headers_reach_the_limiter():
+    praw = pytest.importorskip("praw")
+    recorder = ResponseHeaders()
+    session = recorder.session()
+    session.mount("https://", reddit_adapter(
+        {"x-ratelimit-remaining": "0", "x-ratelimit-used": "100", "x-ratelimit-reset": "42"}
+    ))
+    reddit = praw.Reddit(
+        client_id="id", client_secret="secret", user_agent="rate limit test by /u/tester",
+        requestor_kwargs={"session": session},
+    )
+    assert list(reddit.subreddit("all").search("python", limit=5)) == []
+
+    limiter = RateLimiter("reddit_headers", rate=10, burst=20)
+    limiter.observe_headers(recorder.pop())
+    assert limiter.remaining == 0
+    assert 41 < limiter.stats()["throttled_for"] <= 42
+    assert recorder.pop() is None
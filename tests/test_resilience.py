@@ -0,0 +1,181 @@
+import asyncio
+from collections import deque
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, Hedger, request_deadline
+
+
+class BackendDown(Exception):
+    pass
+
+
+def make_breaker(monkeypatch, failures="2", reset="60", probes="1"):
+    monkeypatch.setenv("TESTBACKEND_BREAKER_FAILURES", failures)
+    monkeypatch.setenv("TESTBACKEND_BREAKER_RESET", reset)
+    monkeypatch.setenv("TESTBACKEND_BREAKER_PROBES", probes)
+    return CircuitBreaker("testbackend")
+
+
+def expire(breaker):
+    breaker.opened_at -= breaker.reset_timeout + 1
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    breaker = make_breaker(monkeypatch)
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before()
+    assert 59 < excinfo.value.retry_in <= 60
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["times_opened"] == 1
+
+
+def test_success_resets_failure_count(monkeypatch):
+    breaker = make_breaker(monkeypatch)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_limits_probes_and_closes_on_success(monkeypatch):
+    breaker = make_breaker(monkeypatch)
+    breaker.failure()
+    breaker.failure()
+    expire(breaker)
+    breaker.before()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before()
+    assert excinfo.value.retry_in == 0.0
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before()
+
+
+def test_failed_probe_reopens_immediately(monkeypatch):
+    breaker = make_breaker(monkeypatch, failures="5")
+    for _ in range(5):
+        breaker.failure()
+    expire(breaker)
+    breaker.before()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()["times_opened"] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+
+def test_call_counts_only_backend_failures(monkeypatch):
+    breaker = make_breaker(monkeypatch, failures="1")
+
+    async def bad_request():
+        raise ValueError("client error")
+
+    async def down():
+        raise BackendDown()
+
+    is_failure = lambda error: isinstance(error, BackendDown)
+    with pytest.raises(ValueError):
+        asyncio.run(breaker.call(bad_request, is_failure))
+    assert breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(BackendDown):
+        asyncio.run(breaker.call(down, is_failure))
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancelled_probe_frees_its_slot(monkeypatch):
+    breaker = make_breaker(monkeypatch, failures="1")
+    breaker.failure()
+    expire(breaker)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def run():
+        task = asyncio.ensure_future(breaker.call(slow, lambda error: True))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before()
+
+
+def make_hedger(monkeypatch, enabled="true"):
+    monkeypatch.setenv("TEST_HEDGE_ENABLED", enabled)
+    monkeypatch.setenv("TEST_HEDGE_PERCENTILE", "0.5")
+    monkeypatch.setenv("TEST_HEDGE_MIN_SAMPLES", "4")
+    monkeypatch.setenv("TEST_HEDGE_MIN_DELAY", "0.01")
+    return Hedger("TEST")
+
+
+def test_hedge_delay_needs_samples_and_respects_minimum(monkeypatch):
+    hedger = make_hedger(monkeypatch)
+    assert hedger.delay_for("reddit") is None
+    hedger._latencies["reddit"] = deque([0.001, 0.002, 0.003])
+    assert hedger.delay_for("reddit") is None
+    hedger._latencies["reddit"].append(0.004)
+    assert hedger.delay_for("reddit") == 0.01
+    hedger._latencies["reddit"] = deque([0.1, 0.2, 0.3, 0.4])
+    assert hedger.delay_for("reddit") == 0.3
+
+
+def test_hedging_is_off_by_default(monkeypatch):
+    hedger = make_hedger(monkeypatch, enabled="false")
+    hedger._latencies["reddit"] = deque([0.1] * 10)
+    assert hedger.delay_for("reddit") is None
+
+
+def test_slow_attempt_is_hedged_and_second_attempt_wins(monkeypatch):
+    hedger = make_hedger(monkeypatch)
+    hedger._latencies["reddit"] = deque([0.01] * 4)
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        await asyncio.sleep(1 if len(attempts) == 1 else 0.001)
+        return len(attempts)
+
+    assert asyncio.run(hedger.run("reddit", fetch)) == 2
+    assert hedger.stats()["backends"]["reddit"] == {
+        "requests": 1, "hedged": 1, "hedge_wins": 1, "hedge_delay": 0.01,
+    }
+
+
+def test_hedge_falls_back_to_surviving_attempt(monkeypatch):
+    hedger = make_hedger(monkeypatch)
+    hedger._latencies["reddit"] = deque([0.01] * 4)
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        if len(attempts) == 2:
+            raise BackendDown()
+        await asyncio.sleep(0.05)
+        return "first"
+
+    assert asyncio.run(hedger.run("reddit", fetch)) == "first"
+    assert hedger.stats()["backends"]["reddit"]["hedge_wins"] == 0
+
+
+def test_hedge_raises_when_every_attempt_fails(monkeypatch):
+    hedger = make_hedger(monkeypatch)
+    hedger._latencies["reddit"] = deque([0.01] * 4)
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        raise BackendDown()
+
+    with pytest.raises(BackendDown):
+        asyncio.run(hedger.run("reddit", fetch))
+
+
+def test_request_deadline_is_none_outside_a_request():
+    assert request_deadline() is None
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_request():
+    flight = SingleFlight()
+    started = []
+
+    async def fetch():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return {"posts": []}
+
+    async def run():
+        return await asyncio.gather(*(flight.do("reddit:python", fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(started) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 5, "upstream_requests": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+
+    async def run():
+        async def fetch(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do("a", lambda: fetch("a")), flight.do("b", lambda: fetch("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert flight.stats()["upstream_requests"] == 2
+
+
+def test_sequential_calls_start_new_requests():
+    flight = SingleFlight()
+    started = []
+
+    async def fetch():
+        started.append(1)
+        return len(started)
+
+    async def run():
+        first = await flight.do("key", fetch)
+        await asyncio.sleep(0)
+        second = await flight.do("key", fetch)
+        return first, second
+
+    assert asyncio.run(run()) == (1, 2)
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_exception_is_shared_and_key_is_released():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        results = await asyncio.gather(flight.do("key", failing), flight.do("key", failing), return_exceptions=True)
+        await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats()["upstream_requests"] == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_request():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from warehouse import Warehouse, fts_phrase, normalize, parse_time
+
+REDDIT = {
+    "posts": [{
+        "id": "p1", "title": "Choosing a vector database", "selftext": "Comparing ai-agents memory stores",
+        "permalink": "https://reddit.com/r/python/comments/p1/", "author": "alice", "score": 42,
+        "created_utc": 1700000000,
+        "comments": [{"id": "c1", "body": "Try sqlite first", "permalink": "https://reddit.com/c1",
+                      "author": "bob", "score": 3, "created_utc": 1700000100}],
+    }],
+}
+TWITTER = {
+    "tweets": [{"id": "t1", "text": "vector search is fun", "author": {"username": "carol"},
+                "metrics": {"like_count": 7}, "created_at": "2023-11-15T00:00:00Z"}],
+}
+SERPAPI = {
+    "results": [
+        {"link": "https://example.com/db", "title": "Vector database guide", "snippet": "A guide", "query": "vector db"},
+        {"link": "No link", "title": "Ignored"},
+    ],
+}
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    monkeypatch.delenv("WAREHOUSE_DISABLED", raising=False)
+    store = Warehouse(str(tmp_path / "warehouse.sqlite3"), writer=False)
+    for source, result in (("reddit", REDDIT), ("twitter", TWITTER), ("serpapi", SERPAPI)):
+        store._write(normalize(source, "vector", result))
+    return store
+
+
+def test_normalize_flattens_every_source():
+    rows = normalize("reddit", "vector", REDDIT) + normalize("twitter", "vector", TWITTER)
+    rows += normalize("serpapi", "vector", SERPAPI)
+    assert [(row["kind"], row["item_id"]) for row in rows] == [
+        ("post", "p1"), ("comment", "c1"), ("tweet", "t1"), ("web", "https://example.com/db"),
+    ]
+    comment, tweet, web = rows[1], rows[2], rows[3]
+    assert comment["parent_id"] == "p1"
+    assert tweet["author"] == "carol" and tweet["score"] == 7
+    assert tweet["created_at"] == parse_time("2023-11-15T00:00:00Z")
+    assert web["keyword"] == "vector db"
+
+
+def test_parse_time_accepts_epoch_and_iso_dates():
+    assert parse_time("1700000000") == 1700000000.0
+    assert parse_time("1970-01-02") == 86400.0
+    assert parse_time("") is None
+    assert parse_time("yesterday") is None
+
+
+def test_fts_phrase_quotes_operators():
+    assert fts_phrase('ai-agents "NEAR" x') == '"ai-agents ""NEAR"" x"'
+
+
+def test_query_matches_text_as_a_phrase(warehouse):
+    assert warehouse.fts
+    rows = warehouse.query("ai-agents")
+    assert [row["item_id"] for row in rows] == ["p1"]
+    assert warehouse.query("database vector") == []
+    assert {row["item_id"] for row in warehouse.query("vector database")} == {"p1", "https://example.com/db"}
+
+
+def test_query_raw_uses_fts_syntax(warehouse):
+    rows = warehouse.query("NEAR(vector database)", raw_query=True)
+    assert {row["item_id"] for row in rows} == {"p1", "https://example.com/db"}
+    assert {row["item_id"] for row in warehouse.query("sqlite OR fun", raw_query=True)} == {"c1", "t1"}
+
+
+def test_query_filters_and_orders(warehouse):
+    assert [row["item_id"] for row in warehouse.query(source="reddit", order="score")] == ["p1", "c1"]
+    assert [row["item_id"] for row in warehouse.query(kind="comment")] == ["c1"]
+    recent = warehouse.query(since=1700000050, until=1700000200)
+    assert [row["item_id"] for row in recent] == ["c1"]
+    with pytest.raises(ValueError):
+        warehouse.query(order="random")
+
+
+def test_latest_only_hides_earlier_fetches(warehouse):
+    updated = {"posts": [dict(REDDIT["posts"][0], score=99, comments=[])]}
+    warehouse._write(normalize("reddit", "vector", updated))
+    assert [row["score"] for row in warehouse.query(kind="post")] == [99]
+    assert len(warehouse.query(kind="post", latest_only=False)) == 2
+
+
+def test_compact_removes_duplicates_and_keeps_fts_in_sync(warehouse):
+    warehouse._write(normalize("reddit", "vector", REDDIT))
+    assert warehouse.compact() == {"expired": 0, "duplicates": 2}
+    assert len(warehouse.query("ai-agents", latest_only=False)) == 1
+    assert warehouse.stats()["rows"] == {"reddit": 2, "serpapi": 1, "twitter": 1}
+
+
+def test_compact_applies_retention(warehouse):
+    old = normalize("twitter", "old", {"tweets": [{"id": "t0", "text": "ancient news"}]})
+    old[0]["fetched_at"] = time.time() - 10 * 86400
+    warehouse._write(old)
+    assert warehouse.compact(retention_days=5)["expired"] == 1
+    assert warehouse.query("ancient news") == []
+
+
+def test_writer_thread_flushes_on_close(tmp_path, monkeypatch):
+    monkeypatch.delenv("WAREHOUSE_DISABLED", raising=False)
+    monkeypatch.setenv("WAREHOUSE_FLUSH_INTERVAL", "60")
+    store = Warehouse(str(tmp_path / "warehouse.sqlite3"))
+    store.ingest("reddit", "vector", REDDIT)
+    store.close()
+    stats = store.stats()
+    assert stats["ingested"] == 2
+    assert stats["batches"] == 1
+    assert stats["bytes"] > 0
+
+
+def test_disabled_warehouse_stores_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv("WAREHOUSE_DISABLED", "true")
+    store = Warehouse(str(tmp_path / "warehouse.sqlite3"))
+    store.ingest("reddit", "vector", REDDIT)
+    assert store.query("vector") == []
+    assert store.stats() == {"enabled": False}
+    assert not (tmp_path / "warehouse.sqlite3").exists()
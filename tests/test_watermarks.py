@@ -0,0 +1,29 @@
+import time
+
+from watermarks import WatermarkStore
+
+
+def test_advance_never_moves_back(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.sqlite3"))
+    assert store.get("reddit", "Python") is None
+    store.advance("reddit", "Python", "b", 200.0)
+    store.advance("reddit", "python ", "a", 100.0)
+    assert store.get("reddit", "python") == {"last_id": "b", "last_created": 200.0}
+
+
+def test_seen_tracks_returned_ids_per_keyword(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.sqlite3"))
+    store.mark_seen("reddit", "Python", ["old_hot", "older_hot"])
+    assert store.seen("reddit", "python", ["old_hot", "fresh"]) == {"old_hot"}
+    assert store.seen("reddit", "rust", ["old_hot"]) == set()
+    assert store.seen("twitter", "python", ["old_hot"]) == set()
+    assert store.seen("reddit", "python", []) == set()
+
+
+def test_seen_ids_expire(tmp_path, monkeypatch):
+    monkeypatch.setenv("WATERMARK_SEEN_DAYS", "1")
+    store = WatermarkStore(str(tmp_path / "watermarks.sqlite3"))
+    store.mark_seen("reddit", "python", ["stale"])
+    store._db.execute("UPDATE seen_items SET seen_at = ?", (time.time() - 2 * 86400,))
+    store.mark_seen("reddit", "python", ["recent"])
+    assert store.seen("reddit", "python", ["stale", "recent"]) == {"recent"}
@@ -2,21 +2,25 @@
 
 import os
 import json
-from fastmcp import FastMCP
-import httpx
+import base64
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+from fastmcp import FastMCP, Context
+from http_pool import get_pool
+from response_cache import ResponseCache, make_key
+from output_format import encode, format_error, project, render, truncate_text
+from metrics import Metrics
+from watermarks import WatermarkStore
+from warehouse import Warehouse
+from query_batching import demultiplex, or_query, pack_keywords
+from rate_limit import RateLimiter, RetryableError, retry_after_from
 from dotenv import load_dotenv
-import logging
+from log_setup import log_payload, setup_logging
+from server_transport import run_server
 
 # Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/twitter_mcp_server.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+logger = setup_logging("twitter_mcp_server")
 
 load_dotenv()
 
@@ -29,70 +33,394 @@ if not TWITTER_BEARER_TOKEN:
     logger.error("TWITTER_BEARER_TOKEN environment variable not set")
     raise ValueError("TWITTER_BEARER_TOKEN environment variable not set")
 
+TWITTER_API_BASE = os.getenv("TWITTER_API_BASE", "https://api.twitter.com")
+TWITTER_SEARCH_URL = f"{TWITTER_API_BASE}/2/tweets/search/recent"
+TWEET_FIELDS = {
+    "tweet.fields": "created_at,author_id,public_metrics",
+    "expansions": "author_id",
+    "user.fields": "username,name,profile_image_url"
+}
+# The recent search endpoint accepts 10-100 results per page
+PAGE_SIZE_MIN = 10
+PAGE_SIZE_MAX = 100
+# Longest query the recent search endpoint accepts on the current access level
+TWITTER_QUERY_MAX_LENGTH = int(os.getenv("TWITTER_QUERY_MAX_LENGTH", "512"))
+# Pages a batched search may read while some keyword still has too few tweets
+TWITTER_BATCH_MAX_PAGES = int(os.getenv("TWITTER_BATCH_MAX_PAGES", "3"))
+
+# Outbound connection pool kept open for the lifetime of the server
+http_pool = get_pool("TWITTER_HTTP", backends={"twitter": 30})
+
+# App-auth recent search allows 450 requests per 15 minutes
+rate_limiter = RateLimiter("twitter", rate=0.5, burst=5)
+
+# Shared two-tier response cache (memory LRU + SQLite)
+response_cache = ResponseCache()
+
+# Newest tweet seen per keyword, for incremental fetching
+watermarks = WatermarkStore()
+
+# Local history of every fetched tweet
+warehouse = Warehouse()
+
 # Create MCP server
 logger.info("Creating Twitter MCP server")
-mcp = FastMCP("twitter-server")
+mcp = FastMCP("twitter-server", lifespan=http_pool.lifespan)
+
+# Per-tool latency, upstream timing and error counters
+metrics = Metrics("twitter")
+metrics.register("cache", response_cache.stats)
+metrics.register("rate_limit", rate_limiter.stats)
+metrics.install_http_endpoint(mcp)
+
+async def _request_recent(params: dict) -> dict:
+    headers = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
+    logger.debug("Sending request to Twitter API with params: %s", params)
+    with metrics.upstream("twitter"):
+        response = await http_pool.client.get(
+            TWITTER_SEARCH_URL, headers=headers, params=params, timeout=http_pool.timeout_for("twitter")
+        )
+    metrics.upstream_status("twitter", response.status_code)
+    rate_limiter.observe_headers(response.headers)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(
+            f"Twitter API returned {response.status_code}",
+            status=response.status_code,
+            retry_after=retry_after_from(response.headers)
+        )
+    response.raise_for_status()
+    result = response.json()
+    log_payload(logger, result, "Received response from Twitter API")
+    return result
+
+async def search_recent(params: dict) -> dict:
+    """Call the recent search endpoint under the rate limiter and return the decoded body."""
+    return await rate_limiter.call(_request_recent, params)
+
+def format_tweets(result: dict, max_results: Optional[int] = None) -> list:
+    """Join tweets with their authors from the `includes` expansion."""
+    tweets = []
+    users = {user["id"]: user for user in result.get("includes", {}).get("users", [])}
+    for tweet in result.get("data", [])[:max_results]:
+        user = users.get(tweet.get("author_id", ""), {})
+        tweet_data = {
+            "id": tweet.get("id", ""),
+            "text": tweet.get("text", ""),
+            "created_at": tweet.get("created_at", ""),
+            "metrics": tweet.get("public_metrics", {}),
+            "author": {
+                "username": f"@{user.get('username', 'unknown')}",
+                "name": user.get("name", "Unknown"),
+                "profile_image": user.get("profile_image_url", "")
+            }
+        }
+        tweets.append(tweet_data)
+    return tweets
+
+def tweet_timestamp(tweet_id: str) -> float:
+    """Creation time encoded in a tweet's snowflake id, in epoch seconds."""
+    return ((int(tweet_id) >> 22) + 1288834974657) / 1000
+
+async def iter_tweet_pages(
+    keyword: str,
+    total: int,
+    page_size: int = PAGE_SIZE_MAX,
+    time_budget: Optional[float] = None
+) -> AsyncIterator[list]:
+    """
+    Yield pages of formatted tweets, following `next_token` until `total` tweets
+    have been yielded, the results run out, or `time_budget` seconds have passed.
+    """
+    page_size = min(max(PAGE_SIZE_MIN, page_size), PAGE_SIZE_MAX)
+    deadline = time.monotonic() + time_budget if time_budget else None
+    remaining = total
+    next_token = None
+    while remaining > 0:
+        params = {"query": keyword, "max_results": max(PAGE_SIZE_MIN, min(page_size, remaining)), **TWEET_FIELDS}
+        if next_token:
+            params["next_token"] = next_token
+        result = await search_recent(params)
+        tweets = format_tweets(result, remaining)
+        if tweets:
+            remaining -= len(tweets)
+            yield tweets
+        next_token = result.get("meta", {}).get("next_token")
+        if not next_token:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.info("Stopping pagination for keyword: %s, time budget of %ss reached", keyword, time_budget)
+            break
 
 @mcp.tool()
-async def fetch_tweets_by_keyword(keyword: str, limit: int = 3) -> str:
+@metrics.tool("fetch_tweets_by_keyword")
+async def fetch_tweets_by_keyword(
+    keyword: str,
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    incremental: bool = False
+) -> str:
     """
     Fetch tweets based on a keyword search.
 
     Args:
         keyword: Keyword to search in tweets
         limit: Number of tweets to fetch (max 10)
+        refresh: Skip the response cache and fetch fresh results
+        output_format: json (indented), compact or msgpack (base64)
+        fields: Tweet fields to return, dotted for nested ones (e.g. ["text", "author.username"])
+        max_text_length: Truncate tweet text to this many characters
+        incremental: Only fetch tweets newer than the last run for this keyword
     """
-    logger.info(f"Fetching tweets for keyword: {keyword}, limit: {limit}")
+    logger.info("Fetching tweets for keyword: %s, limit: %s", keyword, limit)
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    cache_key = make_key("fetch_tweets_by_keyword", {"keyword": keyword, "limit": limit})
+    # Incremental results depend on the stored watermark, so they never come from the cache
+    if not refresh and not incremental:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving cached tweets for keyword: %s", keyword)
+            with metrics.phase("serialize"):
+                return render(json.loads(cached), "tweets", output_format, fields, max_text_length)
     try:
         max_results = min(max(1, limit), 10)
-        params = {
-            "query": keyword,
-            "max_results": max_results,
-            "tweet.fields": "created_at,author_id,public_metrics",
-            "expansions": "author_id",
-            "user.fields": "username,name,profile_image_url"
-        }
-        async with httpx.AsyncClient() as client:
-            headers = {"Authorization": f"Bearer {TWITTER_BEARER_TOKEN}"}
-            logger.debug(f"Sending request to Twitter API with params: {params}")
-            response = await client.get("https://api.twitter.com/2/tweets/search/recent", headers=headers, params=params)
-            response.raise_for_status()
-            result = response.json()
-            logger.debug(f"Received response from Twitter API: {result}")
-
-        tweets = []
-        users = {user["id"]: user for user in result.get("includes", {}).get("users", [])}
-        for tweet in result.get("data", [])[:max_results]:
-            user = users.get(tweet.get("author_id", ""), {})
-            tweet_data = {
-                "id": tweet.get("id", ""),
-                "text": tweet.get("text", ""),
-                "created_at": tweet.get("created_at", ""),
-                "metrics": tweet.get("public_metrics", {}),
-                "author": {
-                    "username": f"@{user.get('username', 'unknown')}",
-                    "name": user.get("name", "Unknown"),
-                    "profile_image": user.get("profile_image_url", "")
-                }
-            }
-            tweets.append(tweet_data)
+        params = {"query": keyword, "max_results": max_results, **TWEET_FIELDS}
+        watermark = watermarks.get("twitter", keyword) if incremental else None
+        if watermark is not None and watermark["last_id"]:
+            params["since_id"] = watermark["last_id"]
+        result = await search_recent(params)
+        tweets = format_tweets(result, max_results)
 
         result = {
             "keyword": keyword,
             "tweets": tweets,
             "count": len(tweets)
         }
-        logger.info(f"Successfully fetched {len(tweets)} tweets for keyword: {keyword}")
-        return json.dumps(result, indent=2)
+        if incremental:
+            since_id = int(watermark["last_id"]) if watermark and watermark["last_id"] else None
+            for tweet in tweets:
+                tweet["is_new"] = since_id is None or int(tweet["id"]) > since_id
+            result["new_count"] = sum(tweet["is_new"] for tweet in tweets)
+            result["since_id"] = str(since_id) if since_id else None
+            if tweets:
+                newest = max(tweets, key=lambda tweet: int(tweet["id"]))
+                watermarks.advance("twitter", keyword, newest["id"], tweet_timestamp(newest["id"]))
+        warehouse.ingest("twitter", keyword, result)
+        logger.info("Successfully fetched %s tweets for keyword: %s", len(tweets), keyword)
+        with metrics.phase("serialize"):
+            if not incremental:
+                response_cache.put("fetch_tweets_by_keyword", cache_key, encode(result, "compact"))
+            return render(result, "tweets", output_format, fields, max_text_length)
+    except Exception as e:
+        logger.error("Failed to fetch tweets: %s", e, exc_info=True)
+        return json.dumps({"error": f"Failed to fetch tweets: {str(e)}"}, indent=2)
+
+async def _search_batch(keywords: List[str], limit: int) -> Tuple[dict, int]:
+    """
+    Run one OR query for a group of keywords and split the tweets back out per keyword.
+    Keywords crowded out by more active ones in the group get a search of their own.
+    Returns the tweets per keyword and the number of search requests made.
+    """
+    query = or_query(keywords)
+    page_size = min(PAGE_SIZE_MAX, max(PAGE_SIZE_MIN, len(keywords) * limit))
+    tweets = []
+    pages = 0
+    assigned = {}
+    page_iter = iter_tweet_pages(query, TWITTER_BATCH_MAX_PAGES * page_size, page_size)
+    try:
+        async for page in page_iter:
+            pages += 1
+            tweets.extend(page)
+            assigned = demultiplex(tweets, keywords, lambda tweet: tweet["text"], limit)
+            if all(len(matched) >= limit for matched in assigned.values()):
+                break
+    finally:
+        await page_iter.aclose()
+    logger.debug("Batched query %r returned %s tweets in %s pages", query, len(tweets), pages)
+    short = [keyword for keyword in keywords if len(assigned.get(keyword, [])) < limit]
+    if short:
+        logger.debug("Backfilling %s keywords of batched query %r", len(short), query)
+        backfills = await asyncio.gather(*(
+            search_recent({"query": keyword, "max_results": max(PAGE_SIZE_MIN, limit), **TWEET_FIELDS})
+            for keyword in short
+        ))
+        assigned.update((keyword, format_tweets(result, limit)) for keyword, result in zip(short, backfills))
+    return assigned, pages + len(short)
+
+@mcp.tool()
+@metrics.tool("fetch_tweets_by_keywords")
+async def fetch_tweets_by_keywords(
+    keywords: List[str],
+    limit: int = 3,
+    refresh: bool = False,
+    output_format: str = "json",
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None
+) -> str:
+    """
+    Fetch tweets for many keywords with as few searches as possible.
+
+    Keywords are packed into OR queries up to the API's query length limit, and the
+    returned tweets are assigned to every keyword they match; a keyword left with
+    fewer than `limit` tweets gets a search of its own. Results are cached per
+    keyword; fresh fetch_tweets_by_keyword results are served from its cache as well.
+
+    Args:
+        keywords: Keywords to search in tweets
+        limit: Number of tweets per keyword (max 10)
+        refresh: Skip the response cache and fetch fresh results
+        output_format: json (indented), compact or msgpack (base64)
+        fields: Tweet fields to return, dotted for nested ones (e.g. ["text", "author.username"])
+        max_text_length: Truncate tweet text to this many characters
+    """
+    format_problem = format_error(output_format)
+    if format_problem:
+        return json.dumps({"error": format_problem}, indent=2)
+    limit = min(max(1, limit), 10)
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword.strip()))
+    logger.info("Fetching tweets for %s keywords, limit: %s", len(keywords), limit)
+    results = {}
+    missing = []
+    for keyword in keywords:
+        cached = None
+        if not refresh:
+            cached = response_cache.get(make_key("fetch_tweets_by_keyword", {"keyword": keyword, "limit": limit}))
+            if cached is None:
+                # Batched results are kept apart: they are not the API's own top tweets for the keyword
+                cached = response_cache.get(make_key("fetch_tweets_by_keywords", {"keyword": keyword, "limit": limit}))
+        if cached is not None:
+            results[keyword] = json.loads(cached)
+        else:
+            missing.append(keyword)
+    try:
+        batches = pack_keywords(missing, TWITTER_QUERY_MAX_LENGTH)
+        searches = 0
+        for assigned, batch_searches in await asyncio.gather(*(_search_batch(batch, limit) for batch in batches)):
+            searches += batch_searches
+            for keyword, tweets in assigned.items():
+                results[keyword] = {"keyword": keyword, "tweets": tweets, "count": len(tweets)}
+                warehouse.ingest("twitter", keyword, results[keyword])
+                response_cache.put(
+                    "fetch_tweets_by_keywords",
+                    make_key("fetch_tweets_by_keywords", {"keyword": keyword, "limit": limit}),
+                    encode(results[keyword], "compact")
+                )
+        logger.info(
+            "Fetched tweets for %s keywords with %s searches in %s batches (%s from cache)",
+            len(keywords), searches, len(batches), len(keywords) - len(missing)
+        )
+        with metrics.phase("serialize"):
+            return encode({
+                "results": [
+                    {**results[keyword], "tweets": truncate_text(project(results[keyword]["tweets"], fields), max_text_length)}
+                    for keyword in keywords
+                ],
+                "count": len(keywords),
+                "searches": searches,
+            }, output_format)
+    except Exception as e:
+        logger.error("Failed to fetch batched tweets: %s", e, exc_info=True)
+        return json.dumps({"error": f"Failed to fetch tweets: {str(e)}"}, indent=2)
+
+def _encode_cursor(state: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+@mcp.tool()
+@metrics.tool("fetch_tweets_paginated")
+async def fetch_tweets_paginated(
+    keyword: str,
+    total: int = 100,
+    page_size: int = 100,
+    time_budget: float = 30.0,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    max_text_length: Optional[int] = None,
+    ctx: Context = None
+) -> str:
+    """
+    Fetch up to `total` tweets for a keyword, one result page per call.
+
+    Each call returns a single page and a `next_cursor`; pass it back as `cursor`
+    to get the following page, so neither side holds the whole pull in memory.
+    `next_cursor` is null once `total` tweets have been returned, the results run
+    out, or `time_budget` seconds have passed since the first page was requested.
+
+    Args:
+        keyword: Keyword to search in tweets
+        total: Maximum number of tweets to fetch across all pages
+        page_size: Tweets requested per page (10-100)
+        time_budget: Stop handing out further pages after this many seconds
+        cursor: next_cursor from the previous page; omit for the first page
+        fields: Tweet fields to return, dotted for nested ones (e.g. ["text", "author.username"])
+        max_text_length: Truncate tweet text to this many characters
+    """
+    try:
+        # The cursor carries the upstream token and the budgets, so calls stay stateless
+        state = _decode_cursor(cursor) if cursor else {
+            "next_token": None, "fetched": 0, "page": 0, "expires_at": time.time() + time_budget
+        }
+        remaining = total - state["fetched"]
+        logger.info("Fetching page %s of tweets for keyword: %s (%s fetched)", state["page"] + 1, keyword, state["fetched"])
+        page_size = min(max(PAGE_SIZE_MIN, page_size), PAGE_SIZE_MAX)
+        params = {"query": keyword, "max_results": max(PAGE_SIZE_MIN, min(page_size, remaining)), **TWEET_FIELDS}
+        if state["next_token"]:
+            params["next_token"] = state["next_token"]
+        result = await search_recent(params) if remaining > 0 else {}
+        tweets = format_tweets(result, max(remaining, 0))
+        warehouse.ingest("twitter", keyword, {"tweets": tweets})
+
+        fetched = state["fetched"] + len(tweets)
+        next_token = result.get("meta", {}).get("next_token")
+        next_cursor = None
+        if next_token and fetched < total and time.time() < state["expires_at"]:
+            next_cursor = _encode_cursor({**state, "next_token": next_token, "fetched": fetched, "page": state["page"] + 1})
+        if ctx is not None:
+            await ctx.report_progress(fetched, total)
+        with metrics.phase("serialize"):
+            return encode({
+                "keyword": keyword,
+                "page": state["page"] + 1,
+                "tweets": truncate_text(project(tweets, fields), max_text_length),
+                "count": len(tweets),
+                "fetched": fetched,
+                "next_cursor": next_cursor,
+            }, "compact")
     except Exception as e:
-        logger.error(f"Failed to fetch tweets: {e}", exc_info=True)
+        logger.error("Failed to fetch tweet page: %s", e, exc_info=True)
         return json.dumps({"error": f"Failed to fetch tweets: {str(e)}"}, indent=2)
 
+@mcp.tool()
+async def rate_limit_stats() -> str:
+    """Return queue depth, wait times and the learned rate limit for the Twitter API."""
+    return json.dumps(rate_limiter.stats(), indent=2)
+
+@mcp.tool()
+async def get_metrics(format: str = "json") -> str:
+    """Return server metrics as a JSON summary or, with format="prometheus", Prometheus text."""
+    if format == "prometheus":
+        return metrics.render()
+    return json.dumps(metrics.snapshot(), indent=2)
+
+@mcp.tool()
+async def cache_stats() -> str:
+    """Return hit/miss counts and size of the response cache."""
+    return json.dumps(response_cache.stats(), indent=2)
+
 if __name__ == "__main__":
     logger.info("Starting Twitter MCP server")
     try:
-        mcp.run()
+        run_server(mcp, "TWITTER", 8002)
         logger.info("Twitter MCP server stopped")
     except Exception as e:
-        logger.error(f"Error running Twitter MCP server: {e}", exc_info=True)
+        logger.error("Error running Twitter MCP server: %s", e, exc_info=True)
         raise
\ No newline at end of file
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""
+Local warehouse of every fetched Reddit post and comment, tweet and web search
+result, with full-text search over their history.
+
+    python warehouse.py search "vector database" --source reddit --since 2025-01-01
+    python warehouse.py top --keyword "ai agents" --limit 10
+    python warehouse.py compact --retention-days 90
+    python warehouse.py stats
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "source", "kind", "item_id", "keyword", "title", "text", "url",
+    "author", "score", "parent_id", "created_at", "fetched_at",
+)
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO 8601 string such as Twitter's created_at."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def fts_phrase(text: str) -> str:
+    """Quote user text as one FTS5 phrase, so hyphens, colons and operators are matched literally."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def normalize(source: str, keyword: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten one tool result into warehouse rows sharing a single schema."""
+    fetched_at = time.time()
+    rows = []
+
+    def row(**values):
+        rows.append({"source": source, "keyword": keyword, "fetched_at": fetched_at, **values})
+
+    for post in result.get("posts", []):
+        row(kind="post", item_id=post.get("id"), title=post.get("title"), text=post.get("selftext"),
+            url=post.get("permalink") or post.get("url"), author=post.get("author"), score=post.get("score"),
+            parent_id=None, created_at=_timestamp(post.get("created_utc")))
+        for comment in post.get("comments", []):
+            row(kind="comment", item_id=comment.get("id"), title=None, text=comment.get("body"),
+                url=comment.get("permalink"), author=comment.get("author"), score=comment.get("score"),
+                parent_id=post.get("id"), created_at=_timestamp(comment.get("created_utc")))
+    for tweet in result.get("tweets", []):
+        tweet_metrics = tweet.get("metrics") or {}
+        row(kind="tweet", item_id=tweet.get("id"), title=None, text=tweet.get("text"),
+            url=f"https://twitter.com/i/status/{tweet.get('id')}",
+            author=(tweet.get("author") or {}).get("username"), score=tweet_metrics.get("like_count"),
+            parent_id=None, created_at=_timestamp(tweet.get("created_at")))
+    for hit in result.get("results", []):
+        if hit.get("link") in (None, "No link"):
+            continue
+        # Merged multi-query searches record the query each result came from
+        row(kind="web", item_id=hit.get("link"), keyword=hit.get("query") or keyword, title=hit.get("title"),
+            text=hit.get("snippet"), url=hit.get("link"), author=None, score=None, parent_id=None, created_at=None)
+    return [item for item in rows if item["item_id"]]
+
+
+class Warehouse:
+    """
+    Append-only SQLite store of normalized tool results with an FTS5 index.
+
+    Rows are queued by `ingest` and written by a background thread in batched
+    transactions, so tools never wait on disk. Every fetch is kept as its own row;
+    `compact` keeps only the newest copy of each item and applies retention.
+    Configuration comes from the environment:
+
+        WAREHOUSE_DISABLED          do not store anything (default off)
+        WAREHOUSE_PATH              SQLite file (default cache/warehouse.sqlite3)
+        WAREHOUSE_BATCH_SIZE        rows per write transaction (default 500)
+        WAREHOUSE_FLUSH_INTERVAL    seconds a queued row may wait to be written (default 2)
+        WAREHOUSE_RETENTION_DAYS    days of history kept by compaction (default 0, keep all)
+    """
+
+    def __init__(self, path: Optional[str] = None, writer: bool = True):
+        self.enabled = os.getenv("WAREHOUSE_DISABLED", "false").lower() not in ("1", "true", "yes")
+        self.path = path or os.getenv("WAREHOUSE_PATH", os.path.join("cache", "warehouse.sqlite3"))
+        self.batch_size = int(os.getenv("WAREHOUSE_BATCH_SIZE", "500"))
+        self.flush_interval = float(os.getenv("WAREHOUSE_FLUSH_INTERVAL", "2"))
+        self.retention_days = float(os.getenv("WAREHOUSE_RETENTION_DAYS", "0"))
+        self.ingested = 0
+        self.batches = 0
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[threading.Thread] = None
+        self.fts = False
+        if not self.enabled:
+            return
+        self._open()
+        if writer:
+            self._writer = threading.Thread(target=self._write_loop, name="warehouse-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Every server process writes here, so wait for another writer's lock instead of failing
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " id INTEGER PRIMARY KEY,"
+            " source TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " item_id TEXT NOT NULL,"
+            " keyword TEXT,"
+            " title TEXT,"
+            " text TEXT,"
+            " url TEXT,"
+            " author TEXT,"
+            " score REAL,"
+            " parent_id TEXT,"
+            " created_at REAL,"
+            " fetched_at REAL NOT NULL)"
+        )
+        for name, columns in (
+            ("items_source", "source, created_at"),
+            ("items_keyword", "keyword, created_at"),
+            ("items_created", "created_at"),
+            ("items_fetched", "fetched_at"),
+            ("items_score", "score"),
+            ("items_identity", "source, kind, item_id, keyword"),
+        ):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON items ({columns})")
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("
+                " title, text, content='items', content_rowid='id')"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN"
+                " INSERT INTO items_fts (rowid, title, text) VALUES (new.id, new.title, new.text); END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN"
+                " INSERT INTO items_fts (items_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text); END"
+            )
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 fall back to LIKE matching
+            logger.warning("FTS5 is not available, full-text queries will scan: %s", e)
+        logger.info("Opened results warehouse at %s", self.path)
+
+    def ingest(self, source: str, keyword: str, result: Dict[str, Any]) -> None:
+        """Queue every item of a tool result for storage; returns immediately."""
+        if not self.enabled:
+            return
+        try:
+            for row in normalize(source, keyword, result):
+                self._queue.put(row)
+        except Exception as e:
+            logger.warning("Could not add %s results to the warehouse: %s", source, e)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    f"INSERT INTO items ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                    [tuple(row.get(column) for column in COLUMNS) for row in rows]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self.ingested += len(rows)
+        self.batches += 1
+
+    def _write_loop(self) -> None:
+        pending: List[Dict[str, Any]] = []
+        flush_at = None
+        stopping = False
+        while not stopping:
+            timeout = None if flush_at is None else max(0.0, flush_at - time.monotonic())
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                row = {}
+            if row is None:
+                stopping = True
+            elif row:
+                pending.append(row)
+                if flush_at is None:
+                    flush_at = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+            # A full batch, an elapsed flush interval or shutdown: write in one transaction
+            if pending:
+                try:
+                    self._write(pending)
+                except Exception as e:
+                    logger.error("Failed to write %s rows to the warehouse: %s", len(pending), e)
+            pending, flush_at = [], None
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer thread."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    def query(
+        self,
+        text: Optional[str] = None,
+        source: Optional[str] = None,
+        keyword: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        order: str = "recent",
+        limit: int = 20,
+        latest_only: bool = True,
+        raw_query: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search stored items. `text` is matched as a phrase over titles and bodies, or
+        used as FTS5 query syntax with `raw_query`; `since`/`until` bound the creation
+        time (fetch time for items without one); `order` is "recent", "score" or, with
+        `text`, "relevance". With `latest_only`, an item fetched many times appears once.
+        """
+        if not self.enabled:
+            return []
+        clauses, params = [], []
+        join = ""
+        if text:
+            if self.fts:
+                join = "JOIN items_fts ON items_fts.rowid = items.id"
+                clauses.append("items_fts MATCH ?")
+                params.append(text if raw_query else fts_phrase(text))
+            else:
+                clauses.append("(items.title LIKE ? OR items.text LIKE ?)")
+                params.extend([f"%{text}%"] * 2)
+        for column, value in (("source", source), ("keyword", keyword), ("kind", kind)):
+            if value:
+                clauses.append(f"items.{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("COALESCE(items.created_at, items.fetched_at) >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("COALESCE(items.created_at, items.fetched_at) < ?")
+            params.append(until)
+        if latest_only:
+            clauses.append(
+                "items.id = (SELECT MAX(latest.id) FROM items AS latest WHERE latest.source = items.source"
+                " AND latest.kind = items.kind AND latest.item_id = items.item_id AND latest.keyword IS items.keyword)"
+            )
+        orders = {
+            "recent": "COALESCE(items.created_at, items.fetched_at) DESC",
+            "score": "items.score IS NULL, items.score DESC",
+            "relevance": "items_fts.rank" if text and self.fts else "COALESCE(items.created_at, items.fetched_at) DESC",
+        }
+        if order not in orders:
+            raise ValueError(f"Unsupported order '{order}', expected one of {', '.join(orders)}")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (
+            f"SELECT {', '.join(f'items.{column}' for column in COLUMNS)} FROM items {join} {where}"
+            f" ORDER BY {orders[order]} LIMIT ?"
+        )
+        with self._lock:
+            rows = self._db.execute(sql, (*params, limit)).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def compact(self, retention_days: Optional[float] = None, vacuum: bool = False) -> Dict[str, int]:
+        """
+        Drop rows fetched before the retention window and all but the newest copy of
+        each item, then optimize the full-text index (and VACUUM when asked).
+        """
+        if not self.enabled:
+            return {"expired": 0, "duplicates": 0}
+        retention_days = self.retention_days if retention_days is None else retention_days
+        with self._lock:
+            self._db.execute("BEGIN")
+            expired = 0
+            if retention_days and retention_days > 0:
+                expired = self._db.execute(
+                    "DELETE FROM items WHERE fetched_at < ?", (time.time() - retention_days * 86400,)
+                ).rowcount
+            duplicates = self._db.execute(
+                "DELETE FROM items WHERE id NOT IN ("
+                " SELECT MAX(id) FROM items GROUP BY source, kind, item_id, keyword)"
+            ).rowcount
+            self._db.execute("COMMIT")
+            if self.fts:
+                self._db.execute("INSERT INTO items_fts (items_fts) VALUES ('optimize')")
+            if vacuum:
+                self._db.execute("VACUUM")
+        logger.info("Compacted warehouse: %s expired and %s duplicate rows removed", expired, duplicates)
+        return {"expired": expired, "duplicates": duplicates}
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            by_source = dict(self._db.execute("SELECT source, COUNT(*) FROM items GROUP BY source").fetchall())
+        return {
+            "enabled": True,
+            "fts": self.fts,
+            "rows": by_source,
+            "ingested": self.ingested,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+            # Recent writes sit in the write-ahead log until a checkpoint
+            "bytes": sum(
+                os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path)
+            ),
+        }
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds from a command line or tool argument given as epoch seconds or an ISO date."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return _timestamp(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and maintain the local results warehouse.")
+    parser.add_argument("--path", help="Warehouse SQLite file (default WAREHOUSE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("search", "Full-text search over stored items"), ("top", "Highest scored stored items")):
+        command = commands.add_parser(name, help=help_text)
+        if name == "search":
+            command.add_argument("text", help="Phrase to search for, e.g. 'ai-agents'")
+            command.add_argument("--raw", action="store_true", help="Treat text as FTS5 query syntax, e.g. 'NEAR(vector database)'")
+        command.add_argument("--source", choices=("reddit", "twitter", "serpapi"))
+        command.add_argument("--keyword", help="Only items fetched for this keyword")
+        command.add_argument("--kind", choices=("post", "comment", "tweet", "web"))
+        command.add_argument("--since", help="Epoch seconds or ISO date, inclusive")
+        command.add_argument("--until", help="Epoch seconds or ISO date, exclusive")
+        command.add_argument("--limit", type=int, default=20)
+        if name == "search":
+            command.add_argument("--order", choices=("relevance", "recent", "score"), default="relevance")
+
+    compact = commands.add_parser("compact", help="Apply retention and drop superseded copies of items")
+    compact.add_argument("--retention-days", type=float, help="Override WAREHOUSE_RETENTION_DAYS")
+    compact.add_argument("--vacuum", action="store_true", help="Also reclaim disk space")
+    commands.add_parser("stats", help="Row counts and size of the warehouse")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    warehouse = Warehouse(args.path, writer=False)
+
+    if args.command in ("search", "top"):
+        started = time.perf_counter()
+        rows = warehouse.query(
+            text=getattr(args, "text", None), source=args.source, keyword=args.keyword, kind=args.kind,
+            since=parse_time(args.since), until=parse_time(args.until),
+            order=getattr(args, "order", "score"), limit=args.limit, raw_query=getattr(args, "raw", False),
+        )
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+        logger.info("%s rows in %.1f ms", len(rows), (time.perf_counter() - started) * 1000)
+    elif args.command == "compact":
+        print(json.dumps(warehouse.compact(args.retention_days, args.vacuum)))
+    else:
+        print(json.dumps(warehouse.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class WatermarkStore:
+    """
+    Persistent per-keyword "seen up to here" markers for incremental fetching.
+
+    Each (source, keyword) pair remembers the newest item id and creation time
+    seen so far, so recurring runs only fetch and process newer items, and the ids
+    of every item returned, for listings such as "hot" that are not in creation order.
+    Configuration comes from the environment:
+
+        WATERMARK_DB_PATH       SQLite file (default cache/watermarks.sqlite3)
+        WATERMARK_SEEN_DAYS     days a returned item id is remembered (default 30)
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("WATERMARK_DB_PATH", os.path.join("cache", "watermarks.sqlite3"))
+        self.seen_days = float(os.getenv("WATERMARK_SEEN_DAYS", "30"))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " source TEXT NOT NULL,"
+            " keyword TEXT NOT NULL,"
+            " last_id TEXT,"
+            " last_created REAL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (source, keyword))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen_items ("
+            " source TEXT NOT NULL,"
+            " keyword TEXT NOT NULL,"
+            " item_id TEXT NOT NULL,"
+            " seen_at REAL NOT NULL,"
+            " PRIMARY KEY (source, keyword, item_id))"
+        )
+
+    @staticmethod
+    def _normalize(keyword: str) -> str:
+        return keyword.strip().lower()
+
+    def get(self, source: str, keyword: str) -> Optional[Dict[str, Any]]:
+        """Return {"last_id", "last_created"} for the keyword, or None on its first run."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_id, last_created FROM watermarks WHERE source = ? AND keyword = ?",
+                (source, self._normalize(keyword))
+            ).fetchone()
+        if row is None:
+            return None
+        return {"last_id": row[0], "last_created": row[1]}
+
+    def advance(self, source: str, keyword: str, last_id: Optional[str], last_created: Optional[float]) -> None:
+        """Move the watermark forward; it never moves back to an older item."""
+        if last_id is None and last_created is None:
+            return
+        current = self.get(source, keyword)
+        if current is not None and current["last_created"] is not None and last_created is not None \
+                and last_created <= current["last_created"]:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO watermarks (source, keyword, last_id, last_created, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (source, self._normalize(keyword), last_id, last_created, time.time())
+            )
+        logger.debug("Advanced %s watermark for %s to %s", source, keyword, last_id)
+
+    def seen(self, source: str, keyword: str, item_ids: Iterable[str]) -> Set[str]:
+        """Return the subset of `item_ids` already returned on an earlier run for the keyword."""
+        item_ids = list(item_ids)
+        if not item_ids:
+            return set()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT item_id FROM seen_items WHERE source = ? AND keyword = ?"
+                f" AND item_id IN ({', '.join('?' for _ in item_ids)})",
+                (source, self._normalize(keyword), *item_ids)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_seen(self, source: str, keyword: str, item_ids: Iterable[str]) -> None:
+        """Remember that these items were returned, forgetting ids older than WATERMARK_SEEN_DAYS."""
+        now = time.time()
+        keyword = self._normalize(keyword)
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO seen_items (source, keyword, item_id, seen_at) VALUES (?, ?, ?, ?)",
+                [(source, keyword, item_id, now) for item_id in item_ids]
+            )
+            if self.seen_days > 0:
+                self._db.execute(
+                    "DELETE FROM seen_items WHERE source = ? AND keyword = ? AND seen_at < ?",
+                    (source, keyword, now - self.seen_days * 86400)
+                )
+            self._db.execute("COMMIT")